@@ -0,0 +1,360 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+from bson import ObjectId
+from mongodb_operations import (INDEXES, ingest_cache_key, pack_embeddings, retry_later,
+                                unpack_embeddings, unwritten_records)
+
+load_dotenv()
+
+class AsyncWriteBehindBuffer:
+    """
+    asyncio counterpart of WriteBehindBuffer: groups inserts per collection into ordered
+    insert_many batches, flushed by a background task on an interval or when a
+    collection reaches max_batch_size records. Failed writes are retried the same way.
+    """
+    def __init__(self, db, max_batch_size=100, flush_interval=1.0, max_retries=3):
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.pending = {}  # collection name -> records in insertion order
+        self.failures = {}  # collection name -> consecutive failed flushes
+        self.flush_lock = None  # Created on first use, inside the running loop
+        self.wakeup = None
+        self.flusher = None
+
+    def add(self, collection_name, record):
+        if self.flusher is None:
+            self.flush_lock = asyncio.Lock()
+            self.wakeup = asyncio.Event()
+            self.flusher = asyncio.create_task(self._run())
+        records = self.pending.setdefault(collection_name, [])
+        records.append(record)
+        if len(records) >= self.max_batch_size:
+            self.wakeup.set()
+
+    async def flush(self, collection_name=None):
+        if self.flush_lock is None:
+            return
+        async with self.flush_lock:
+            if collection_name is None:
+                batches, self.pending = self.pending, {}
+            else:
+                batches = {collection_name: self.pending.pop(collection_name, [])}
+            for name, records in batches.items():
+                if not records:
+                    continue
+                # A retry may include records that already landed; unordered, the rest still go in
+                ordered = name not in self.failures
+                try:
+                    await self.db[name].insert_many(records, ordered=ordered)
+                    self.failures.pop(name, None)
+                except PyMongoError as e:
+                    retry_later(self.pending, self.failures, self.max_retries,
+                                name, unwritten_records(records, e, ordered), e)
+
+    async def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+            self.flusher = None
+        while self.pending:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+class AsyncMongoDBOperations:
+    """
+    Same surface as MongoDBOperations on the asyncio-native Motor driver, so the workflow
+    can await queries directly instead of hopping through the default thread pool.
+    Pool size and timeouts come from the MONGODB_* environment variables.
+    """
+    def __init__(self):
+        load_dotenv()
+        self.MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
+        self.client = AsyncIOMotorClient(
+            self.MONGODB_CONNECTION_STRING,
+            maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+            minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+            maxIdleTimeMS=int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000")),
+            waitQueueTimeoutMS=int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+            connectTimeoutMS=int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "10000")),
+            serverSelectionTimeoutMS=int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+            socketTimeoutMS=int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000"))
+        )
+        self.db = self.client['echolearn']
+        self.documents = self.db['documents']
+        self.user_responses = self.db['user_responses']
+        self.evaluations = self.db['evaluations']
+        self.embeddings = self.db['embeddings']
+        self.chat_history = self.db['chat_history']
+        self.chat_summaries = self.db['chat_summaries']
+        self.question_references = self.db['question_references']
+        self.ingest_cache = self.db['ingest_cache']
+        self.embedding_cache = self.db['embedding_cache']
+        self.llm_cache = self.db['llm_cache']
+        self.write_buffer = AsyncWriteBehindBuffer(
+            self.db,
+            max_batch_size=int(os.getenv("MONGODB_WRITE_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("MONGODB_WRITE_FLUSH_INTERVAL", "1.0"))
+        )
+        self.indexes_ensured = False
+
+    async def ensure_indexes(self):
+        if self.indexes_ensured:
+            return
+        for name, models in INDEXES.items():
+            try:
+                await self.db[name].create_indexes(models)
+            except OperationFailure as e:
+                print(f"Error creating indexes on {name}: {e}")
+        self.indexes_ensured = True
+
+    async def test_connection(self):
+        try:
+            await self.client.admin.command('ping')
+            print("Pinged your deployment. You successfully connected to MongoDB!")
+            return True
+        except PyMongoError as e:
+            print(f"Connection to MongoDB failed: {e}")
+            return False
+
+    async def insert_document(self, title, s3_url):
+        return (await self.documents.insert_one({
+            "title": title,
+            "s3_url": s3_url,
+            "upload_date": datetime.utcnow()
+        })).inserted_id
+
+    async def get_all_documents(self):
+        return await self.documents.find().to_list(length=None)
+
+    async def insert_user_response(self, user_id, document_id, response):
+        return (await self.user_responses.insert_one({
+            "user_id": user_id,
+            "document_id": document_id,
+            "response": response,
+            "timestamp": datetime.utcnow()
+        })).inserted_id
+
+    async def get_document_by_id(self, doc_id):
+        """Retrieve a document by its MongoDB ObjectID."""
+        try:
+            return await self.documents.find_one({"_id": ObjectId(doc_id)})
+        except Exception as e:
+            print(f"Error retrieving document: {e}")
+            return None
+
+    async def insert_evaluation(self, user_id, document_id, score):
+        return (await self.evaluations.insert_one({
+            "user_id": user_id,
+            "document_id": document_id,
+            "score": score,
+            "timestamp": datetime.utcnow()
+        })).inserted_id
+
+    def buffer_evaluation(self, user_id, document_id, score):
+        """Queue an evaluation for the next batched write instead of inserting it now."""
+        self.write_buffer.add(self.evaluations.name, {
+            "user_id": user_id,
+            "document_id": document_id,
+            "score": score,
+            "timestamp": datetime.utcnow()
+        })
+
+    async def insert_or_update_embedding(self, document_id, embeddings, text, model=None):
+        """
+        Store a document's chunk embeddings as a matrix (a list with one vector per chunk),
+        tagged with the embedding model that produced them.
+        """
+        return (await self.embeddings.update_one(
+            {"document_id": ObjectId(document_id)},
+            {"$set": {
+                **pack_embeddings(embeddings),
+                "model": model,
+                "text": text,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )).upserted_id
+
+    async def get_embedding(self, document_id, include_text=False):
+        projection = None if include_text else {"text": 0}
+        return unpack_embeddings(await self.embeddings.find_one({"document_id": ObjectId(document_id)}, projection))
+
+    async def iter_embeddings(self, model=None):
+        """
+        Stream every stored chunk matrix, leaving the document text on the server. Given a
+        model, only its vectors (and untagged ones stored before tagging) are returned.
+        """
+        query = {} if model is None else {"model": {"$in": [model, None]}}
+        projection = {"document_id": 1, "embeddings": 1, "dtype": 1, "shape": 1, "model": 1}
+        async for record in self.embeddings.find(query, projection):
+            yield unpack_embeddings(record)
+
+    async def get_document_content(self, doc_id):
+        try:
+            document = await self.documents.find_one({"_id": ObjectId(doc_id)}, {"content": 1})
+            if document:
+                return document.get("content", "")
+            else:
+                return ""
+        except Exception as e:
+            print(f"Error retrieving document content: {e}")
+            return ""
+
+    async def insert_chat_history(self, chat_entry):
+        return (await self.chat_history.insert_one(chat_entry)).inserted_id
+
+    def buffer_chat_history(self, chat_entry):
+        """Queue a chat-history entry for the next batched write instead of inserting it now."""
+        self.write_buffer.add(self.chat_history.name, chat_entry)
+
+    async def flush_writes(self):
+        await self.write_buffer.flush()
+
+    async def get_chat_history(self, doc_id):
+        # Read-your-writes: anything still buffered has to land before we query
+        await self.write_buffer.flush(self.chat_history.name)
+        projection = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        cursor = self.chat_history.find({"document_id": ObjectId(doc_id)}, projection).sort("timestamp", 1)
+        return await cursor.to_list(length=None)
+
+    async def get_recent_chat_history(self, doc_id, after=None, limit=None):
+        """
+        The newest entries (at most limit) written after the given timestamp, oldest first.
+        Reads the suffix of the history from the (document_id, timestamp) index.
+        """
+        await self.write_buffer.flush(self.chat_history.name)
+        query = {"document_id": ObjectId(doc_id)}
+        if after is not None:
+            query["timestamp"] = {"$gt": after}
+        projection = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        cursor = self.chat_history.find(query, projection).sort("timestamp", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return (await cursor.to_list(length=None))[::-1]
+
+    async def get_chat_summary(self, doc_id):
+        return await self.chat_summaries.find_one({"_id": ObjectId(doc_id)})
+
+    async def save_chat_summary(self, doc_id, summary, covered_until):
+        """Store the running summary of every chat-history entry up to covered_until."""
+        await self.chat_summaries.update_one(
+            {"_id": ObjectId(doc_id)},
+            {"$set": {
+                "summary": summary,
+                "covered_until": covered_until,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    async def get_question_references(self, doc_id):
+        return unpack_embeddings(await self.question_references.find_one({"_id": ObjectId(doc_id)}))
+
+    async def save_question_references(self, doc_id, questions, embeddings, model=None):
+        """Store the generated questions with one reference vector per question."""
+        await self.question_references.update_one(
+            {"_id": ObjectId(doc_id)},
+            {"$set": {
+                "questions": questions,
+                **pack_embeddings(embeddings),
+                "model": model,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    async def get_ingest_cache(self, content_hash, model):
+        return unpack_embeddings(await self.ingest_cache.find_one({"_id": ingest_cache_key(content_hash, model)}))
+
+    async def save_ingest_cache(self, content_hash, text, embeddings, questions, model):
+        """Only complete ingests belong here; process_pdf skips the save when any chunk failed."""
+        return (await self.ingest_cache.update_one(
+            {"_id": ingest_cache_key(content_hash, model)},
+            {"$set": {
+                "model": model,
+                "text": text,
+                **pack_embeddings(embeddings),
+                "questions": questions,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )).upserted_id
+
+    async def get_cached_embeddings(self, keys):
+        found = {entry["_id"]: entry["embedding"]
+                 async for entry in self.embedding_cache.find({"_id": {"$in": keys}}, {"embedding": 1})}
+        if found:
+            await self.embedding_cache.update_many(
+                {"_id": {"$in": list(found)}},
+                {"$set": {"last_used": datetime.utcnow()}}
+            )
+        return found
+
+    async def save_cached_embeddings(self, items):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"_id": key}, {"$set": {"embedding": embedding, "last_used": now}}, upsert=True)
+            for key, embedding in items.items()
+        ]
+        if operations:
+            await self.embedding_cache.bulk_write(operations, ordered=False)
+
+    async def trim_embedding_cache(self, max_entries):
+        excess = await self.embedding_cache.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = [entry["_id"] async for entry in
+                     self.embedding_cache.find({}, {"_id": 1}).sort("last_used", 1).limit(excess)]
+        return (await self.embedding_cache.delete_many({"_id": {"$in": stale_ids}})).deleted_count
+
+    async def get_llm_response(self, key):
+        """Return the unexpired cached LLM response record for key, refreshing its last-used time."""
+        return await self.llm_cache.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+            {"$set": {"last_used": datetime.utcnow()}},
+            projection={"response": 1, "expires_at": 1}
+        )
+
+    async def save_llm_response(self, key, model, response, ttl_seconds):
+        now = datetime.utcnow()
+        await self.llm_cache.update_one(
+            {"_id": key},
+            {"$set": {
+                "model": model,
+                "response": response,
+                "last_used": now,
+                "expires_at": now + timedelta(seconds=ttl_seconds)
+            }},
+            upsert=True
+        )
+
+    async def trim_llm_cache(self, max_entries):
+        """Evict the least recently used cached LLM responses beyond max_entries."""
+        excess = await self.llm_cache.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = [entry["_id"] async for entry in
+                     self.llm_cache.find({}, {"_id": 1}).sort("last_used", 1).limit(excess)]
+        return (await self.llm_cache.delete_many({"_id": {"$in": stale_ids}})).deleted_count
+
+    async def close_connection(self):
+        await self.write_buffer.close()
+        self.client.close()
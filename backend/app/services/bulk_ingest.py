@@ -0,0 +1,214 @@
+import os
+import io
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+from chunker import StreamingChunker
+from main import PDFProcessingWorkflow
+from pdf_processor import PDFProcessor
+
+def _extract_pages(pdf_bytes):
+    """Runs in an extraction worker process."""
+    return [page_text for _, page_text in PDFProcessor.iter_pages(io.BytesIO(pdf_bytes))]
+
+class StageStats:
+    def __init__(self):
+        self.items = 0
+        self.busy_seconds = 0.0
+
+class BulkIngestPipeline:
+    """
+    Backfills many PDFs at once. download -> extract -> chunk/embed -> store run as
+    concurrent stages with their own worker counts, connected by bounded queues so a
+    fast stage blocks instead of piling up documents in memory. Finished URIs are appended
+    to a progress file, and a rerun with the same file skips them.
+    """
+    STAGES = ("download", "extract", "embed", "store")
+
+    def __init__(self, workflow, progress_path, download_workers=4, extract_workers=None,
+                 embed_workers=4, store_workers=2, queue_size=8):
+        self.workflow = workflow
+        self.progress_path = progress_path
+        self.workers = {
+            "download": download_workers,
+            "extract": extract_workers or os.cpu_count() or 1,
+            "embed": embed_workers,
+            "store": store_workers,
+        }
+        self.queue_size = queue_size
+        self.stats = {stage: StageStats() for stage in self.STAGES}
+        self.failed = {}
+        self.bytes_downloaded = 0
+        self.pages = 0
+        self.chunks = 0
+        self.progress_file = None
+
+    def completed_uris(self):
+        if not os.path.exists(self.progress_path):
+            return set()
+        with open(self.progress_path) as f:
+            return {json.loads(line)["uri"] for line in f if line.strip()}
+
+    async def run(self, uris):
+        done = self.completed_uris()
+        pending = [uri for uri in uris if uri not in done]
+        print(f"{len(pending)} documents to ingest ({len(uris) - len(pending)} already done)")
+
+        try:
+            await self.workflow.mongo_ops.ensure_indexes()
+            queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.STAGES]
+            handlers = [self.download, self.extract, self.embed, self.store]
+            started = time.perf_counter()
+
+            with open(self.progress_path, "a") as self.progress_file, \
+                    ProcessPoolExecutor(max_workers=self.workers["extract"]) as self.extract_pool:
+                feeder = asyncio.create_task(self._feed(pending, queues[0]))
+                stages = []
+                for index, (stage, handler) in enumerate(zip(self.STAGES, handlers)):
+                    output = queues[index + 1] if index + 1 < len(queues) else None
+                    stages.append(asyncio.create_task(
+                        self._run_stage(stage, handler, queues[index], output)))
+                await feeder
+                await asyncio.gather(*stages)
+        finally:
+            # Flushes buffered writes and closes the Mongo and embedder clients before the loop goes away
+            await self.workflow.close()
+
+        self.report(time.perf_counter() - started)
+
+    async def _feed(self, uris, queue):
+        for uri in uris:
+            await queue.put(uri)
+        for _ in range(self.workers["download"]):
+            await queue.put(None)
+
+    async def _run_stage(self, stage, handler, input_queue, output_queue):
+        async def worker():
+            while True:
+                item = await input_queue.get()
+                if item is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    result = await handler(item)
+                except Exception as e:
+                    uri = item if isinstance(item, str) else item["uri"]
+                    self.failed[uri] = f"{stage}: {e}"
+                    print(f"Failed to ingest {uri} during {stage}: {e}")
+                    continue
+                finally:
+                    self.stats[stage].busy_seconds += time.perf_counter() - started
+                self.stats[stage].items += 1
+                if output_queue is not None and result is not None:
+                    await output_queue.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(self.workers[stage])))
+        # Every worker of this stage has stopped; tell each downstream worker to stop too
+        if output_queue is not None:
+            next_stage = self.STAGES[self.STAGES.index(stage) + 1]
+            for _ in range(self.workers[next_stage]):
+                await output_queue.put(None)
+
+    async def download(self, uri):
+        parsed_uri = urlparse(uri)
+        buffer = await asyncio.to_thread(self.workflow.s3_service.download_fileobj,
+                                         parsed_uri.netloc, parsed_uri.path.lstrip('/'))
+        if buffer is None:
+            raise Exception("download failed")
+        with buffer:
+            pdf_bytes = await asyncio.to_thread(buffer.read)
+        self.bytes_downloaded += len(pdf_bytes)
+        return {"uri": uri, "pdf_bytes": pdf_bytes}
+
+    async def extract(self, item):
+        loop = asyncio.get_running_loop()
+        pages = await loop.run_in_executor(self.extract_pool, _extract_pages, item.pop("pdf_bytes"))
+        self.pages += len(pages)
+
+        embedder = self.workflow.embedder
+        overlap = min(self.workflow.chunk_overlap_tokens, embedder.max_tokens // 4)
+
+        def chunk_pages():
+            chunker = StreamingChunker(embedder.tokenizer, embedder.max_tokens, overlap)
+            chunks = []
+            for page_text in pages:
+                chunks.extend(chunker.feed(page_text))
+            return chunks + chunker.flush()
+
+        item["text"] = "\n".join(pages).strip()
+        item["chunks"] = await asyncio.to_thread(chunk_pages)
+        return item
+
+    async def embed(self, item):
+        chunks = item.pop("chunks")
+        embeddings = await self.workflow.embedder.agenerate_embeddings(chunks) if chunks else []
+        # The embedder returns None for failed batches; storing the rest would mark the
+        # document done with missing chunks, so fail it and leave it for the next run
+        if any(e is None for e in embeddings):
+            raise Exception(f"{sum(e is None for e in embeddings)} of {len(chunks)} chunks failed to embed")
+        item["embeddings"] = embeddings or None
+        self.chunks += len(chunks)
+        return item
+
+    async def store(self, item):
+        mongo_ops = self.workflow.mongo_ops
+        doc_id = await mongo_ops.insert_document(item["uri"], item["text"])
+        await mongo_ops.insert_or_update_embedding(doc_id, item["embeddings"], item["text"],
+                                                   self.workflow.embedder.model)
+        self.progress_file.write(json.dumps({"uri": item["uri"], "document_id": str(doc_id)}) + "\n")
+        self.progress_file.flush()
+
+    def report(self, elapsed):
+        ingested = self.stats["store"].items
+        print("=" * 50)
+        print(f"Ingested {ingested} documents in {elapsed:.1f}s "
+              f"({ingested / elapsed if elapsed else 0:.2f} docs/s), {len(self.failed)} failed")
+        print(f"Downloaded {self.bytes_downloaded / 1e6:.1f} MB "
+              f"({self.bytes_downloaded / 1e6 / elapsed if elapsed else 0:.2f} MB/s), "
+              f"{self.pages} pages, {self.chunks} chunks")
+        for stage in self.STAGES:
+            stats = self.stats[stage]
+            # Utilization near 1.0 marks the bottleneck stage; give it more workers
+            utilization = stats.busy_seconds / (elapsed * self.workers[stage]) if elapsed else 0
+            print(f"  {stage:<9} workers={self.workers[stage]:<3} items={stats.items:<6} "
+                  f"utilization={utilization:.0%}")
+        for uri, reason in self.failed.items():
+            print(f"  failed: {uri} ({reason})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs from S3")
+    parser.add_argument("uris", nargs="*", help="s3://bucket/key URIs to ingest")
+    parser.add_argument("--prefix", help="Ingest every object under this prefix of --bucket")
+    parser.add_argument("--bucket", default=os.getenv("S3_BUCKET_NAME"))
+    parser.add_argument("--progress-file", default="bulk_ingest_progress.jsonl")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--extract-workers", type=int, default=None, help="Defaults to the CPU count")
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--store-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=8)
+    args = parser.parse_args()
+
+    workflow = PDFProcessingWorkflow()
+    uris = list(args.uris)
+    if args.prefix is not None:
+        uris.extend(f"s3://{args.bucket}/{obj['Key']}"
+                    for obj in workflow.s3_service.iter_objects(args.prefix, bucket_name=args.bucket)
+                    if obj['Key'].lower().endswith(".pdf"))
+    if not uris:
+        parser.error("give at least one URI or --prefix")
+
+    pipeline = BulkIngestPipeline(
+        workflow, args.progress_file,
+        download_workers=args.download_workers,
+        extract_workers=args.extract_workers,
+        embed_workers=args.embed_workers,
+        store_workers=args.store_workers,
+        queue_size=args.queue_size
+    )
+    asyncio.run(pipeline.run(uris))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import re
+from collections import deque
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+class Chunk(str):
+    """Chunk text that carries the token count the chunker already computed for it."""
+    def __new__(cls, text, token_count):
+        chunk = super().__new__(cls, text)
+        chunk.token_count = token_count
+        return chunk
+
+    def __getnewargs__(self):
+        return str(self), self.token_count
+
+class StreamingChunker:
+    """
+    Incrementally turns a stream of page texts into sentence-aligned chunks of at most
+    max_tokens, each starting with up to overlap_tokens of the previous chunk's tail.
+
+    Every sentence is encoded exactly once and only its token count is kept, so memory is
+    bounded by one chunk rather than the whole document. Token IDs are decoded only for
+    the rare sentence that is longer than max_tokens on its own. Chunks are emitted as
+    Chunk strings whose token_count lets the embedder skip re-encoding them.
+    """
+    def __init__(self, tokenizer, max_tokens, overlap_tokens=200):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+        self.sentences = deque()  # (sentence, token count) in the chunk being built
+        self.token_count = 0
+        self.carried_tokens = 0  # Tokens at the front of the chunk repeated from the last one
+        self.pending = ""  # Trailing fragment that may continue on the next page
+
+    def feed(self, text):
+        """Add the next page of text; returns the chunks it completed."""
+        parts = SENTENCE_BOUNDARY.split(f"{self.pending} {text}".strip())
+        # The last part has no boundary after it yet, so hold it back until more text arrives
+        self.pending = parts.pop()
+
+        chunks = []
+        for sentence in parts:
+            chunks.extend(self._add_sentence(sentence))
+
+        # Text without sentence boundaries (tables, slides, OCR output) would otherwise pile up
+        # in pending until flush(). A token is at least one character, so the token count is
+        # only checked once there are enough characters to possibly fill a chunk.
+        if len(self.pending) > self.max_tokens:
+            fragment = " ".join(self.pending.split())
+            tokens = self.tokenizer.encode(fragment)
+            if len(tokens) >= self.max_tokens:
+                chunks.extend(self._add_sentence(fragment, tokens))
+                self.pending = ""
+        return chunks
+
+    def flush(self):
+        """Emit whatever is left once the stream has ended."""
+        chunks = self._add_sentence(self.pending)
+        self.pending = ""
+        chunks.extend(self._emit())
+        self._reset()
+        return chunks
+
+    def _add_sentence(self, sentence, tokens=None):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            return []
+        if tokens is None:
+            tokens = self.tokenizer.encode(sentence)
+        # +1 for the joining space, which can add a token at the boundary
+        token_count = len(tokens) + 1
+
+        if token_count > self.max_tokens:
+            # A single sentence larger than a chunk gets hard-split on token windows
+            chunks = self._emit()
+            step = self.max_tokens - self.overlap_tokens
+            for start in range(0, max(len(tokens) - self.overlap_tokens, 1), step):
+                window = tokens[start:start + self.max_tokens]
+                chunks.append(Chunk(self.tokenizer.decode(window), len(window)))
+            self._reset()
+            return chunks
+
+        chunks = []
+        if self.token_count + token_count > self.max_tokens:
+            chunks = self._emit()
+            # Drop carried-over sentences if the overlap and this sentence don't fit together
+            while self.sentences and self.token_count + token_count > self.max_tokens:
+                _, dropped = self.sentences.popleft()
+                self.token_count -= dropped
+                self.carried_tokens -= dropped
+        self.sentences.append((sentence, token_count))
+        self.token_count += token_count
+        return chunks
+
+    def _emit(self):
+        # A buffer holding only the previous chunk's overlap has nothing new to emit
+        if self.token_count <= self.carried_tokens:
+            return []
+        chunk = Chunk(" ".join(sentence for sentence, _ in self.sentences), self.token_count)
+
+        # Keep the longest tail of whole sentences that fits in the overlap budget
+        overlap, overlap_tokens = deque(), 0
+        for sentence, token_count in reversed(self.sentences):
+            if overlap_tokens + token_count > self.overlap_tokens:
+                break
+            overlap.appendleft((sentence, token_count))
+            overlap_tokens += token_count
+        self.sentences = overlap
+        self.token_count = overlap_tokens
+        self.carried_tokens = overlap_tokens
+        return [chunk]
+
+    def _reset(self):
+        self.sentences.clear()
+        self.token_count = 0
+        self.carried_tokens = 0
@@ -1,10 +1,47 @@
 import os
+import random
+import asyncio
+import httpx
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import tiktoken
+import threading
 
-class JinaAIEmbedder:
-    def __init__(self):
+class BaseEmbedder:
+    """
+    Interface shared by all embedding backends. Subclasses set model, tokenizer and
+    max_tokens and implement generate_embeddings; the async methods default to running
+    the synchronous implementation on a worker thread.
+    """
+    model = None
+    tokenizer = None
+    max_tokens = None
+
+    def generate_embedding(self, text: str):
+        if not text:
+            raise ValueError("Input text cannot be empty")
+
+        return self.generate_embeddings([text])[0]
+
+    def generate_embeddings(self, texts: list[str]):
+        raise NotImplementedError
+
+    async def agenerate_embedding(self, text: str):
+        if not text:
+            raise ValueError("Input text cannot be empty")
+
+        return (await self.agenerate_embeddings([text]))[0]
+
+    async def agenerate_embeddings(self, texts: list[str]):
+        return await asyncio.to_thread(self.generate_embeddings, texts)
+
+    async def aclose(self):
+        pass
+
+class JinaAIEmbedder(BaseEmbedder):
+    def __init__(self, pool_maxsize=10):
         load_dotenv()
         self.api_key = os.getenv('JINAAI_API_KEY')
         if not self.api_key:
@@ -18,45 +55,96 @@ class JinaAIEmbedder:
         self.model = 'jina-embeddings-v2-base-en'
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
         self.max_tokens = 8000  # Setting slightly below the limit for safety
+        self.max_batch_inputs = 128  # Inputs packed into a single request
+        self.max_batch_tokens = 64000  # Total tokens packed into a single request
 
-    def generate_embedding(self, text: str):
-        if not text:
+        # Reuse keep-alive connections across requests instead of reconnecting per chunk
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+
+    def generate_embeddings(self, texts: list[str]):
+        """
+        Embed several texts using as few requests as the API's size limits allow.
+        Texts longer than max_tokens are split into chunks whose embeddings are averaged.
+        Returns one embedding per input text, or None for texts that failed.
+        """
+        if not texts or any(not text for text in texts):
             raise ValueError("Input text cannot be empty")
 
-        # Tokenize the text
-        tokens = self.tokenizer.encode(text)
-
-        # If the text is too long, we'll need to split it
-        if len(tokens) > self.max_tokens:
-            print(f"Text is too long ({len(tokens)} tokens). Splitting into chunks.")
-            chunks = self.split_into_chunks(tokens)
-            embeddings = []
-            for chunk in chunks:
-                chunk_text = self.tokenizer.decode(chunk)
-                embedding = self._generate_single_embedding(chunk_text)
-                if embedding:
-                    embeddings.append(embedding)
-            # Average the embeddings if we have multiple chunks
-            if embeddings:
-                return [sum(x) / len(embeddings) for x in zip(*embeddings)]
+        pieces = self._split_pieces(texts)
+        piece_embeddings = []
+        for batch in self._pack_batches(pieces):
+            embeddings = self._post_embeddings([piece_text for _, piece_text, _ in batch])
+            piece_embeddings.extend(embeddings or [None] * len(batch))
+
+        return self._merge_pieces(len(texts), pieces, piece_embeddings)
+
+    def _split_pieces(self, texts):
+        """Flatten texts into (owner index, text, token count) pieces that fit the per-input limit."""
+        pieces = []
+        for index, text in enumerate(texts):
+            # Chunks from StreamingChunker already know their size; don't encode them twice
+            token_count = getattr(text, "token_count", None)
+            if token_count is not None and token_count <= self.max_tokens:
+                pieces.append((index, text, token_count))
+                continue
+            tokens = self.tokenizer.encode(text)
+            if len(tokens) > self.max_tokens:
+                print(f"Text is too long ({len(tokens)} tokens). Splitting into chunks.")
+                for chunk in self.split_into_chunks(tokens):
+                    pieces.append((index, self.tokenizer.decode(chunk), len(chunk)))
             else:
-                return None
-        else:
-            return self._generate_single_embedding(text)
+                pieces.append((index, text, len(tokens)))
+        return pieces
+
+    def _merge_pieces(self, text_count, pieces, piece_embeddings):
+        grouped = [[] for _ in range(text_count)]
+        for (index, _, _), embedding in zip(pieces, piece_embeddings):
+            if embedding:
+                grouped[index].append(embedding)
+
+        results = []
+        for embeddings in grouped:
+            if not embeddings:
+                results.append(None)
+            elif len(embeddings) == 1:
+                results.append(embeddings[0])
+            else:
+                # Inputs over max_tokens still need a single vector here; callers that want
+                # per-chunk vectors should chunk before calling (see process_pdf)
+                results.append(np.mean(embeddings, axis=0).tolist())
+        return results
+
+    def _pack_batches(self, pieces):
+        batch, batch_tokens = [], 0
+        for piece in pieces:
+            token_count = piece[2]
+            if batch and (len(batch) >= self.max_batch_inputs or batch_tokens + token_count > self.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(piece)
+            batch_tokens += token_count
+        if batch:
+            yield batch
 
-    def _generate_single_embedding(self, text: str):
+    def _post_embeddings(self, inputs):
         request_data = {
-            'input': [text],
+            'input': inputs,
             'model': self.model
         }
         
+        response = None
         try:
-            response = requests.post(self.api_url, headers=self.headers, json=request_data)
+            response = self.session.post(self.api_url, json=request_data)
             response.raise_for_status()
-            return response.json()['data'][0]['embedding']
+            # The API may return items out of order; 'index' maps them back to inputs
+            data = sorted(response.json()['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in data]
         except requests.RequestException as e:
             print(f"Error generating embedding: {str(e)}")
-            if response.text:
+            if response is not None and response.text:
                 print(f"Response content: {response.text}")
             return None
 
@@ -64,4 +152,134 @@ class JinaAIEmbedder:
         chunks = []
         for i in range(0, len(tokens), self.max_tokens):
             chunks.append(tokens[i:i + self.max_tokens])
-        return chunks
\ No newline at end of file
+        return chunks
+
+class AsyncJinaAIEmbedder(JinaAIEmbedder):
+    """
+    Non-blocking variant of JinaAIEmbedder. Batches are sent in parallel over a shared
+    httpx.AsyncClient, at most max_concurrency at a time, and requests that hit 429/5xx
+    or a transport error are retried with jittered exponential backoff.
+    """
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_concurrency=8, max_retries=5, backoff_base=0.5, backoff_max=20.0, timeout=30.0):
+        super().__init__(pool_maxsize=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = None
+
+    def _get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+        return self.client
+
+    async def agenerate_embeddings(self, texts: list[str]):
+        """Async counterpart of generate_embeddings; all batches are requested concurrently."""
+        if not texts or any(not text for text in texts):
+            raise ValueError("Input text cannot be empty")
+
+        pieces = self._split_pieces(texts)
+        batches = list(self._pack_batches(pieces))
+        batch_results = await asyncio.gather(*(
+            self._apost_embeddings([piece_text for _, piece_text, _ in batch]) for batch in batches
+        ))
+
+        piece_embeddings = []
+        for batch, embeddings in zip(batches, batch_results):
+            piece_embeddings.extend(embeddings or [None] * len(batch))
+
+        return self._merge_pieces(len(texts), pieces, piece_embeddings)
+
+    async def _apost_embeddings(self, inputs):
+        request_data = {
+            'input': inputs,
+            'model': self.model
+        }
+
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    response = await self._get_client().post(self.api_url, json=request_data)
+                    if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                        await asyncio.sleep(self._backoff_delay(attempt, response.headers.get('Retry-After')))
+                        continue
+                    response.raise_for_status()
+                    data = sorted(response.json()['data'], key=lambda item: item['index'])
+                    return [item['embedding'] for item in data]
+                except httpx.TransportError as e:
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(self._backoff_delay(attempt))
+                        continue
+                    print(f"Error generating embedding: {str(e)}")
+                    return None
+                except httpx.HTTPStatusError as e:
+                    print(f"Error generating embedding: {str(e)}")
+                    if response is not None and response.text:
+                        print(f"Response content: {response.text}")
+                    return None
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent retries from hammering the API in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+class LocalEmbedder(BaseEmbedder):
+    """
+    Offline backend that runs a sentence-transformers model on CPU. The model is loaded
+    once; inputs are encoded in batches with torch limited to num_threads intra-op threads.
+    """
+    def __init__(self, model_name='all-MiniLM-L6-v2', batch_size=32, num_threads=None, device='cpu'):
+        # Imported here so the Jina-only path never pays for loading torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.encoder = SentenceTransformer(model_name, device=device)
+        self.model = model_name
+        self.batch_size = batch_size
+        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.max_tokens = self.encoder.max_seq_length  # Longer inputs are truncated by the model
+        self.lock = threading.Lock()  # One encode at a time; torch already parallelizes inside it
+
+    def generate_embeddings(self, texts: list[str]):
+        if not texts or any(not text for text in texts):
+            raise ValueError("Input text cannot be empty")
+
+        with self.lock:
+            embeddings = self.encoder.encode(texts, batch_size=self.batch_size,
+                                             convert_to_numpy=True, show_progress_bar=False)
+        return [embedding.tolist() for embedding in embeddings]
+
+def create_embedder(backend=None):
+    """Build the embedding backend named by `backend` or the EMBEDDER_BACKEND env var."""
+    backend = (backend or os.getenv("EMBEDDER_BACKEND", "jina")).lower()
+    if backend == "jina":
+        return AsyncJinaAIEmbedder(max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "8")))
+    if backend == "local":
+        num_threads = os.getenv("LOCAL_EMBEDDING_THREADS")
+        return LocalEmbedder(
+            model_name=os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+            batch_size=int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32")),
+            num_threads=int(num_threads) if num_threads else None
+        )
+    raise ValueError(f"Unknown embedder backend: {backend}")
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+async def call_store(mongo_ops, method, *args):
+    """Await a Mongo-layer method whether it belongs to the sync or the async implementation."""
+    function = getattr(mongo_ops, method)
+    if asyncio.iscoroutinefunction(function):
+        return await function(*args)
+    return await asyncio.to_thread(function, *args)
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model, normalized-text hash): a bounded in-process
+    LRU in front of the Mongo 'embedding_cache' collection. Both tiers evict least
+    recently used entries once they exceed their size limits.
+    """
+    TRIM_EVERY = 100  # Persistent writes between size checks on the Mongo collection
+
+    def __init__(self, mongo_ops=None, max_entries=10000, max_persistent_entries=1000000):
+        self.mongo_ops = mongo_ops
+        self.max_entries = max_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.writes_since_trim = 0
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @staticmethod
+    def make_key(model, text):
+        normalized = EmbeddingCache.normalize(text)
+        return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: embedding} for the keys found in either tier."""
+        self._require_sync_store()
+        found = self._lookup_memory(keys)
+        remaining = [key for key in keys if key not in found]
+        if remaining and self.mongo_ops is not None:
+            self._record_persistent(found, self.mongo_ops.get_cached_embeddings(remaining))
+        self._record_misses(keys, found)
+        return found
+
+    async def aget_many(self, keys):
+        """get_many for async callers; works with either the sync or the async Mongo layer."""
+        found = self._lookup_memory(keys)
+        remaining = [key for key in keys if key not in found]
+        if remaining and self.mongo_ops is not None:
+            self._record_persistent(found, await call_store(self.mongo_ops, "get_cached_embeddings", remaining))
+        self._record_misses(keys, found)
+        return found
+
+    def put_many(self, items):
+        """Store {key: embedding} in both tiers."""
+        self._require_sync_store()
+        if not items:
+            return
+        self._remember(items)
+        if self.mongo_ops is not None:
+            self.mongo_ops.save_cached_embeddings(items)
+            if self._due_for_trim(len(items)):
+                self.mongo_ops.trim_embedding_cache(self.max_persistent_entries)
+
+    async def aput_many(self, items):
+        if not items:
+            return
+        self._remember(items)
+        if self.mongo_ops is not None:
+            await call_store(self.mongo_ops, "save_cached_embeddings", items)
+            if self._due_for_trim(len(items)):
+                await call_store(self.mongo_ops, "trim_embedding_cache", self.max_persistent_entries)
+
+    def _require_sync_store(self):
+        # The blocking methods can't await Motor coroutines; async stores need aget_many/aput_many
+        if self.mongo_ops is not None and asyncio.iscoroutinefunction(self.mongo_ops.get_cached_embeddings):
+            raise TypeError(f"{type(self.mongo_ops).__name__} is async; use aget_many/aput_many "
+                            "(or agenerate_embedding(s) on CachedEmbedder)")
+
+    def _lookup_memory(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+            self.hits += len(found)
+        return found
+
+    def _record_persistent(self, found, persisted):
+        self._remember(persisted)
+        found.update(persisted)
+        with self.lock:
+            self.persistent_hits += len(persisted)
+
+    def _record_misses(self, keys, found):
+        with self.lock:
+            self.misses += len(set(keys) - set(found))
+
+    def _due_for_trim(self, written):
+        with self.lock:
+            self.writes_since_trim += written
+            if self.writes_since_trim < self.TRIM_EVERY:
+                return False
+            self.writes_since_trim = 0
+            return True
+
+    def _remember(self, items):
+        with self.lock:
+            for key, embedding in items.items():
+                self.entries[key] = embedding
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries)
+        }
+
+class CachedEmbedder:
+    """
+    Wraps an embedder so byte-identical (after whitespace normalization) texts are only
+    embedded once. Everything not overridden here is delegated to the wrapped embedder.
+    """
+    def __init__(self, embedder, cache):
+        self.embedder = embedder
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
+
+    def generate_embedding(self, text: str):
+        if not text:
+            raise ValueError("Input text cannot be empty")
+
+        return self.generate_embeddings([text])[0]
+
+    def generate_embeddings(self, texts: list[str]):
+        keys = [self.cache.make_key(self.embedder.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = self._missing(texts, keys, found)
+        if missing:
+            embeddings = self.embedder.generate_embeddings(list(missing.values()))
+            stored = self._successful(missing, embeddings)
+            self.cache.put_many(stored)
+            found.update(stored)
+
+        return [found.get(key) for key in keys]
+
+    async def agenerate_embedding(self, text: str):
+        if not text:
+            raise ValueError("Input text cannot be empty")
+
+        return (await self.agenerate_embeddings([text]))[0]
+
+    async def agenerate_embeddings(self, texts: list[str]):
+        keys = [self.cache.make_key(self.embedder.model, text) for text in texts]
+        found = await self.cache.aget_many(keys)
+
+        missing = self._missing(texts, keys, found)
+        if missing:
+            embeddings = await self.embedder.agenerate_embeddings(list(missing.values()))
+            stored = self._successful(missing, embeddings)
+            await self.cache.aput_many(stored)
+            found.update(stored)
+
+        return [found.get(key) for key in keys]
+
+    @staticmethod
+    def _missing(texts, keys, found):
+        # Deduplicate within the request too, keyed so results can be mapped back
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return missing
+
+    @staticmethod
+    def _successful(missing, embeddings):
+        return {key: embedding for key, embedding in zip(missing, embeddings) if embedding}
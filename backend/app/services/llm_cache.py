@@ -0,0 +1,86 @@
+import time
+import json
+import hashlib
+import threading
+from datetime import timezone
+from collections import OrderedDict
+from embedding_cache import call_store
+
+class LLMResponseCache:
+    """
+    Prompt-result cache for LLM calls keyed by (model, prompt hash, generation parameters).
+    A bounded in-process LRU sits in front of the Mongo 'llm_cache' collection; entries in
+    both tiers expire after ttl_seconds, and the collection is trimmed to
+    max_persistent_entries in least-recently-used order.
+    """
+    TRIM_EVERY = 50  # Persistent writes between size checks on the Mongo collection
+
+    def __init__(self, mongo_ops=None, max_entries=1000, max_persistent_entries=100000, ttl_seconds=7 * 24 * 3600):
+        self.mongo_ops = mongo_ops
+        self.max_entries = max_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (response, expiry as a time.time() value)
+        self.lock = threading.Lock()
+        self.writes_since_trim = 0
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        material = json.dumps({"model": model, "prompt": prompt, "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+
+        if self.mongo_ops is not None:
+            record = await call_store(self.mongo_ops, "get_llm_response", key)
+            if record is not None:
+                # Keep the persisted expiry rather than granting a fresh TTL on promotion
+                expires_at = record["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+                self._remember(key, record["response"], expires_at)
+                with self.lock:
+                    self.persistent_hits += 1
+                return record["response"]
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    async def put(self, key, model, response):
+        self._remember(key, response)
+        if self.mongo_ops is not None:
+            await call_store(self.mongo_ops, "save_llm_response", key, model, response, self.ttl_seconds)
+            with self.lock:
+                self.writes_since_trim += 1
+                due = self.writes_since_trim >= self.TRIM_EVERY
+                if due:
+                    self.writes_since_trim = 0
+            if due:
+                await call_store(self.mongo_ops, "trim_llm_cache", self.max_persistent_entries)
+
+    def _remember(self, key, response, expires_at=None):
+        with self.lock:
+            self.entries[key] = (response, expires_at or time.time() + self.ttl_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries)
+        }
@@ -1,36 +1,152 @@
 import os
 import asyncio
-import json
-import time
-import pyaudio
-import boto3
-import sounddevice
-import numpy as np
+import threading
 from datetime import datetime
+from functools import cached_property
 from urllib.parse import urlparse
 import uuid
-import google.generativeai as genai
-from concurrent.futures import ThreadPoolExecutor
-from amazon_transcribe.client import TranscribeStreamingClient
-from amazon_transcribe.handlers import TranscriptResultStreamHandler
-from amazon_transcribe.model import TranscriptEvent
-from embedder import JinaAIEmbedder
-from s3_service import S3Service
+from embedding_cache import EmbeddingCache, CachedEmbedder
+from llm_cache import LLMResponseCache
+from prompt_context import PromptContextBuilder
 from pdf_processor import PDFProcessor
-from mongodb_operations import MongoDBOperations
+from chunker import StreamingChunker
+
+# Clients and heavy modules (boto3, pymongo, numpy, tiktoken, Gemini, Transcribe, PortAudio)
+# are imported on first use, so jobs that never touch audio or chat don't pay for them.
+
+async def iterate_in_thread(make_iterator):
+    """
+    Drive a blocking iterator on a worker thread and yield its items on the event loop.
+    Closing or cancelling the consumer stops the thread at its next item, so an abandoned
+    stream (a discarded Gemini prefetch, say) isn't pulled to the end for nothing.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def post(item):
+        if not stop.is_set():
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def produce():
+        iterator = iter(make_iterator())
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                post(item)
+        except Exception as e:
+            post(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        post(done)
+
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    # An abandoned producer finishes on its own; retrieve its result so nothing is reported
+    producer.add_done_callback(lambda t: t.cancelled() or t.exception())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+    await producer
+
+async def gather_or_cancel(*aws):
+    """asyncio.gather that cancels the other awaitables as soon as one of them fails."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled siblings unwind before the original error propagates
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
 class PDFProcessingWorkflow:
     def __init__(self):
-        self.s3_service = S3Service()
         self.pdf_processor = PDFProcessor()
-        self.embedder = JinaAIEmbedder()
-        self.mongo_ops = MongoDBOperations()
-        
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        self.model = genai.GenerativeModel("gemini-pro")
-        
         self.aws_region = os.getenv('AWS_REGION', 'us-east-1')
-        self.transcribe_client = TranscribeStreamingClient(region=self.aws_region)
+
+        self.pdf_workers = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+        self.score_top_k = int(os.getenv("SCORE_TOP_K", "1"))
+        self.chunk_overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
+        # Chunks per agenerate_embeddings call during ingest; the embedder packs each into requests
+        self.embed_batch_chunks = int(os.getenv("EMBED_BATCH_CHUNKS", "16"))
+        self.model_name = "gemini-pro"
+        self.generation_config = {}  # Part of the LLM cache key, so changing it invalidates old responses
+        self.vector_index = None  # Loaded from MongoDB on first search
+        self.vector_index_lock = None  # Created on first use, inside the running loop
+        # Speculatively generated follow-up questions: doc_id -> (task, history version it was built from)
+        self.prefetched_questions = {}
+        self.history_versions = {}  # doc_id -> count of chat-history writes this session
+        self.reference_builds = {}  # doc_id -> reference-vector builds still running
+
+    @cached_property
+    def s3_service(self):
+        from s3_service import S3Service
+        return S3Service()
+
+    @cached_property
+    def mongo_ops(self):
+        from async_mongodb_operations import AsyncMongoDBOperations
+        return AsyncMongoDBOperations()
+
+    @cached_property
+    def embedding_cache(self):
+        return EmbeddingCache(
+            self.mongo_ops,
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            max_persistent_entries=int(os.getenv("EMBEDDING_CACHE_PERSISTENT_SIZE", "1000000"))
+        )
+
+    @cached_property
+    def embedder(self):
+        from embedder import create_embedder
+        # EMBEDDER_BACKEND selects the remote Jina API ("jina") or an offline model ("local")
+        return CachedEmbedder(create_embedder(), self.embedding_cache)
+
+    @cached_property
+    def question_references(self):
+        from question_references import QuestionReferenceIndex
+        return QuestionReferenceIndex(self.mongo_ops, self.embedder)
+
+    @cached_property
+    def prompt_context(self):
+        # Token counts use the embedder's tokenizer (tiktoken cl100k_base for Jina)
+        return PromptContextBuilder(
+            self.mongo_ops, self.generate_content, self.embedder.tokenizer,
+            max_tokens=int(os.getenv("PROMPT_CONTEXT_MAX_TOKENS", "3000")),
+            summary_tokens=int(os.getenv("PROMPT_CONTEXT_SUMMARY_TOKENS", "500"))
+        )
+
+    @cached_property
+    def llm_cache(self):
+        return LLMResponseCache(
+            self.mongo_ops,
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+            max_persistent_entries=int(os.getenv("LLM_CACHE_PERSISTENT_SIZE", "100000")),
+            ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        )
+
+    @cached_property
+    def model(self):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        return genai.GenerativeModel(self.model_name)
+
+    @cached_property
+    def transcribe_client(self):
+        from amazon_transcribe.client import TranscribeStreamingClient
+        return TranscribeStreamingClient(region=self.aws_region)
 
     async def speech_to_text(self):
         stream = await self.transcribe_client.start_stream_transcription(
@@ -42,19 +158,18 @@ class PDFProcessingWorkflow:
         async def write_chunks():
             print("\n🎙️ Recording... (Speak now)")
             print("=" * 50)
-            start_time = time.time()
-            async for chunk, _ in MicStream().mic_stream():
+            mic = MicStream()
+            # mic_stream ends the stream itself once the detector sees the end of the utterance
+            async for chunk, _ in mic.mic_stream():
                 await stream.input_stream.send_audio_event(audio_chunk=chunk)
-                
-                # Ensure a minimum recording time of 3 seconds
-                if time.time() - start_time > 3 and MicStream.is_silent(chunk):
-                    print("\n🛑 Silence detected. Stopping recording...")
-                    break
-            
+            if mic.vad.heard_speech:
+                print("\n🛑 Silence detected. Stopping recording...")
+
             await stream.input_stream.end_stream()
             print("=" * 50)
             print("Recording finished. Processing...")
 
+        from transcript_handler import TranscriptHandler
         handler = TranscriptHandler(stream.output_stream)
         await asyncio.gather(write_chunks(), handler.handle_events())
         
@@ -64,80 +179,316 @@ class PDFProcessingWorkflow:
             return await self.speech_to_text()
         return transcript
     
-    async def run_workflow(self, s3_uri):
-        doc_id, questions = await self.process_pdf(s3_uri)
-        print(f"Document processed. ID: {doc_id}")
-        print("Generated questions:")
-        for i, question in enumerate(questions, 1):
-            print(f"{i}. {question}")
+    async def run_workflow(self, s3_uri, user_id=None):
+        shown = []
+
+        def show_question(question):
+            if not shown:
+                print("Generated questions:")
+            shown.append(question)
+            print(f"{len(shown)}. {question}")
+
+        try:
+            # Questions print as Gemini produces them; a cached ingest returns them all at once
+            doc_id, questions = await self.process_pdf(s3_uri, on_question=show_question)
+            for question in questions[len(shown):]:
+                show_question(question)
+            print(f"Document processed. ID: {doc_id}")
 
-        while True:
-            print("\nPlease speak your answer (or say 'more' for more questions, 'quit' to exit)")
-            user_answer = await self.speech_to_text()
-            print(f"Transcribed answer: {user_answer}")
+            while True:
+                print("\nPlease speak your answer (or say 'more' for more questions, 'quit' to exit)")
+                # Generate the next batch while the learner is talking so "more" answers instantly
+                self.prefetch_more_questions(doc_id)
+                user_answer = await self.speech_to_text()
+                print(f"Transcribed answer: {user_answer}")
             
-            if 'quit' in user_answer.lower():
-                break
-            elif 'more' in user_answer.lower():
-                new_questions = await self.generate_more_questions(doc_id)
-                print("Additional questions:")
-                for i, question in enumerate(new_questions, 1):
-                    print(f"{i}. {question}")
-            else:
-                await self.save_chat_history(doc_id, "user", user_answer)
-                score = await self.evaluate_answer(doc_id, user_answer)
-                print(f"Your understanding score: {score}%")
+                if 'quit' in user_answer.lower():
+                    self.discard_prefetch(doc_id)
+                    break
+                elif 'more' in user_answer.lower():
+                    print("Additional questions:")
+                    i = 0
+                    async for question in self.stream_more_questions(doc_id):
+                        i += 1
+                        print(f"{i}. {question}")
+                else:
+                    await self.save_chat_history(doc_id, "user", user_answer)
+                    score = await self.evaluate_answer(doc_id, user_answer)
+                    self.mongo_ops.buffer_evaluation(user_id, doc_id, score)
+                    print(f"Your understanding score: {score}%")
+        finally:
+            # Runs on errors and Ctrl-C too, so buffered chat history and evaluations are written
+            await self.close()
+
+    async def close(self):
+        """Flush buffered writes, stop the flusher and release clients created this session."""
+        for doc_id in list(self.prefetched_questions):
+            self.discard_prefetch(doc_id)
+        # cached_property stores created clients in __dict__; don't create one just to close it
+        if 'mongo_ops' in self.__dict__:
+            await self.mongo_ops.close_connection()
+        if 'embedder' in self.__dict__:
+            await self.embedder.aclose()
 
     async def upload_file(self, file_path):
         file_name = os.path.basename(file_path)
         object_name = f"uploads/{str(uuid.uuid4())}-{file_name}"
         bucket_name = os.getenv("S3_BUCKET_NAME")
 
-        if await asyncio.to_thread(self.s3_service.upload_file, file_path, object_name):
+        # Tag the object with its content hash so process_pdf can skip re-ingesting known bytes
+        content_hash = await asyncio.to_thread(self.pdf_processor.content_hash, file_path)
+        metadata = {self.s3_service.CONTENT_HASH_METADATA_KEY: content_hash}
+
+        if await asyncio.to_thread(self.s3_service.upload_file, file_path, object_name, metadata):
             return f"s3://{bucket_name}/{object_name}"
         else:
             raise Exception("Failed to upload file to S3")
 
-    async def process_pdf(self, s3_uri):
+    async def process_pdf(self, s3_uri, on_question=None):
+        """
+        Ingest the PDF at s3_uri and return (doc_id, questions). on_question, if given, is
+        called with each generated question as soon as it has streamed in.
+        """
+        await self.mongo_ops.ensure_indexes()
+
         parsed_uri = urlparse(s3_uri)
         bucket_name = parsed_uri.netloc
         object_key = parsed_uri.path.lstrip('/')
 
-        local_path = f"/tmp/{os.path.basename(object_key)}"
-        await asyncio.to_thread(self.s3_service.download_file, bucket_name, object_key, local_path)
-
-        pdf_text = await asyncio.to_thread(self.pdf_processor.extract_text, local_path)
-        embedding = await asyncio.to_thread(self.embedder.generate_embedding, pdf_text)
-
-        doc_id = await asyncio.to_thread(self.mongo_ops.insert_document, s3_uri, pdf_text)
-        await asyncio.to_thread(self.mongo_ops.insert_or_update_embedding, doc_id, embedding, pdf_text)
-
-        questions = await self.generate_questions(pdf_text, doc_id)
-
-        os.remove(local_path)
+        metadata = await asyncio.to_thread(self.s3_service.get_object_metadata, bucket_name, object_key)
+        content_hash = (metadata or {}).get(self.s3_service.CONTENT_HASH_METADATA_KEY)
+        if content_hash:
+            cached = await self.load_cached_ingest(s3_uri, content_hash)
+            if cached:
+                return cached
+
+        pdf_buffer = await asyncio.to_thread(self.s3_service.download_fileobj, bucket_name, object_key)
+        if pdf_buffer is None:
+            raise Exception(f"Failed to download {s3_uri} from S3")
+
+        # Embed sentence-aligned chunks while later pages are still being extracted
+        page_texts = []
+        chunker = StreamingChunker(self.embedder.tokenizer, self.embedder.max_tokens,
+                                   min(self.chunk_overlap_tokens, self.embedder.max_tokens // 4))
+        embedding_tasks = []
+        pending_chunks = []
+
+        def embed_pending():
+            # Micro-batches keep the embedder's batch packing while extraction continues
+            embedding_tasks.append(asyncio.create_task(self.embedder.agenerate_embeddings(list(pending_chunks))))
+            pending_chunks.clear()
+
+        try:
+            with pdf_buffer:
+                if not content_hash:
+                    # Objects uploaded without a hash tag get hashed here instead
+                    content_hash = await asyncio.to_thread(self.pdf_processor.content_hash, pdf_buffer)
+                    cached = await self.load_cached_ingest(s3_uri, content_hash)
+                    if cached:
+                        return cached
+
+                async for _, page_text in self.stream_pages(pdf_buffer):
+                    page_texts.append(page_text)
+                    # Sentence encoding is CPU-bound; keep it off the loop other sessions share
+                    pending_chunks.extend(await asyncio.to_thread(chunker.feed, page_text))
+                    if len(pending_chunks) >= self.embed_batch_chunks:
+                        embed_pending()
+            pending_chunks.extend(await asyncio.to_thread(chunker.flush))
+            if pending_chunks:
+                embed_pending()
+
+            pdf_text = "\n".join(page_texts).strip()
+            doc_id = await self.mongo_ops.insert_document(s3_uri, pdf_text)
+
+            async def store_embeddings():
+                # One row per chunk; scoring takes the best-matching chunks rather than a blurred average
+                results = [e for batch in await asyncio.gather(*embedding_tasks) for e in batch]
+                embedding = [e for e in results if e] or None
+                await self.mongo_ops.insert_or_update_embedding(doc_id, embedding, pdf_text, self.embedder.model)
+                self.add_to_vector_index(doc_id, embedding)
+                return embedding, bool(results) and len(embedding or []) == len(results)
+
+            async def collect_questions():
+                questions = []
+                async for question in self.stream_questions(pdf_text, doc_id):
+                    questions.append(question)
+                    if on_question is not None:
+                        on_question(question)
+                return questions
+
+            # Question generation only needs the text and id, so it runs alongside the embedding
+            # branch; ingest takes as long as the slower of the two rather than their sum
+            (embedding, all_embedded), questions = await gather_or_cancel(
+                store_embeddings(), collect_questions())
+        except BaseException:
+            # Don't leave chunk embeddings running unobserved once ingest has failed
+            for task in embedding_tasks:
+                task.cancel()
+            raise
+        self.build_question_references(doc_id, questions, embedding)
+        # The cache has no expiry, so a partial ingest (failed chunks, no questions) would be
+        # replayed for every later upload of the same bytes; leave it for a retry instead
+        if all_embedded and questions:
+            await self.mongo_ops.save_ingest_cache(content_hash, pdf_text, embedding, questions,
+                                                   self.embedder.model)
 
         return doc_id, questions
 
-    async def generate_questions(self, text, doc_id):
+    async def load_cached_ingest(self, s3_uri, content_hash):
+        """Replay cached text, embedding and questions for PDF bytes that were already ingested."""
+        # Keyed by embedding model too, so switching EMBEDDER_BACKEND never replays foreign vectors
+        cached = await self.mongo_ops.get_ingest_cache(content_hash, self.embedder.model)
+        if not cached or cached.get('embeddings') is None or not cached.get('questions'):
+            return None
+
+        doc_id = await self.mongo_ops.insert_document(s3_uri, cached['text'])
+        await self.mongo_ops.insert_or_update_embedding(doc_id, cached['embeddings'], cached['text'],
+                                                        self.embedder.model)
+        self.add_to_vector_index(doc_id, cached['embeddings'])
+        await self.save_chat_history(doc_id, "system", cached['questions'])
+        self.build_question_references(doc_id, cached['questions'], cached['embeddings'])
+
+        return doc_id, cached['questions']
+
+    def add_to_vector_index(self, doc_id, embedding):
+        # Before the index is loaded, new documents are picked up from MongoDB by load()
+        if self.vector_index is not None and embedding is not None:
+            self.vector_index.add(doc_id, embedding)
+
+    async def get_vector_index(self):
+        if self.vector_index_lock is None:
+            # On Python 3.9 a lock made before asyncio.run is bound to another loop
+            self.vector_index_lock = asyncio.Lock()
+        async with self.vector_index_lock:
+            if self.vector_index is None:
+                from vector_index import VectorIndex
+                index = VectorIndex(
+                    mode=os.getenv("VECTOR_INDEX_MODE", "auto"),
+                    approx_threshold=int(os.getenv("VECTOR_INDEX_APPROX_THRESHOLD", "50000"))
+                )
+                self.vector_index = await index.aload(self.mongo_ops, self.embedder.model)
+        return self.vector_index
+
+    async def find_related(self, text, k=5, exclude_doc_id=None):
+        """Return (document_id, chunk_index, similarity) for the stored passages closest to text."""
+        index = await self.get_vector_index()
+        query = await self.embedder.agenerate_embedding(text)
+        # Over-fetch when one document is excluded so k results survive the filter
+        matches = await asyncio.to_thread(index.search, query, 2 * k if exclude_doc_id else k)
+        return [match for match in matches if match[0] != exclude_doc_id][:k]
+
+    async def stream_pages(self, pdf_file):
+        """Async wrapper over PDFProcessor.iter_pages; extraction runs on a worker thread."""
+        from s3_service import S3_SPOOL_DIR
+        async for page in iterate_in_thread(
+                lambda: self.pdf_processor.iter_pages(pdf_file, self.pdf_workers, S3_SPOOL_DIR)):
+            yield page
+
+    async def stream_content(self, prompt, fresh=False):
+        """
+        Yield Gemini's completion for prompt piece by piece as it is generated. A cached
+        response (unless fresh is set) arrives as a single piece; a completed stream is cached.
+        """
+        key = self.llm_cache.make_key(self.model_name, prompt, self.generation_config)
+        if not fresh:
+            cached = await self.llm_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        def stream_response():
+            response = self.model.generate_content(prompt, stream=True,
+                                                   generation_config=self.generation_config)
+            for chunk in response:
+                yield chunk.text
+
+        pieces = []
+        async for piece in iterate_in_thread(stream_response):
+            pieces.append(piece)
+            yield piece
+        # A fresh response replaces the cached one, so later identical prompts see it
+        await self.llm_cache.put(key, self.model_name, "".join(pieces))
+
+    async def generate_content(self, prompt, fresh=False):
+        """Gemini completion for prompt, served from the LLM cache unless fresh is set."""
+        return "".join([piece async for piece in self.stream_content(prompt, fresh)])
+
+    async def stream_lines(self, prompt, fresh=False):
+        """Yield each non-blank line of the completion as soon as its newline arrives."""
+        pending = ""
+        async for piece in self.stream_content(prompt, fresh):
+            *lines, pending = (pending + piece).split('\n')
+            for line in lines:
+                if line.strip():
+                    yield line.strip()
+        if pending.strip():
+            yield pending.strip()
+
+    async def stream_questions(self, text, doc_id, fresh=False):
+        """Yield questions as they stream in; the batch is saved to chat history once complete."""
         prompt = f"Based on the following text, generate 5 questions to test the reader's understanding:\n\n{text[:4000]}"
-        response = await asyncio.to_thread(self.model.generate_content, prompt)
-        questions = response.text.strip().split('\n')
-        
+        questions = []
+        async for question in self.stream_lines(prompt, fresh):
+            questions.append(question)
+            yield question
+
         await self.save_chat_history(doc_id, "system", questions)
-        
-        return questions
 
-    async def evaluate_answer(self, doc_id, user_answer):
-        doc_embedding = await asyncio.to_thread(self.mongo_ops.get_embedding, doc_id)
-        answer_embedding = await asyncio.to_thread(self.embedder.generate_embedding, user_answer)
+    async def generate_questions(self, text, doc_id, fresh=False):
+        return [question async for question in self.stream_questions(text, doc_id, fresh)]
 
-        similarity = np.dot(doc_embedding['embeddings'], answer_embedding) / (
-            np.linalg.norm(doc_embedding['embeddings']) * np.linalg.norm(answer_embedding)
-        )
+    def build_question_references(self, doc_id, questions, chunk_embeddings=None):
+        """Build scoring references for new questions in the background; evaluate_answer waits for them."""
+        task = asyncio.create_task(self.question_references.add(doc_id, questions, chunk_embeddings))
+        builds = self.reference_builds.setdefault(doc_id, set())
+        builds.add(task)
+        task.add_done_callback(builds.discard)
+        # Failures are reported by evaluate_answer; retrieve them here in case it never runs
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def evaluate_answer(self, doc_id, user_answer):
+        builds = self.reference_builds.get(doc_id)
+        if builds:
+            for result in await asyncio.gather(*builds, return_exceptions=True):
+                if isinstance(result, Exception):
+                    print(f"Error building question references: {result}")
+
+        answer_embedding = await self.embedder.agenerate_embedding(user_answer)
+        # Score against the generated question the answer matches best
+        similarity = await self.question_references.score(doc_id, answer_embedding)
+        if similarity is None:
+            # Documents without question references fall back to their best-matching chunks
+            doc_embedding = await self.mongo_ops.get_embedding(doc_id)
+            if not doc_embedding or doc_embedding.get('embeddings') is None:
+                print(f"No embeddings stored for document {doc_id}; cannot score the answer")
+                return 0
+            try:
+                if doc_embedding.get('model') not in (None, self.embedder.model):
+                    raise ValueError(f"embedded with {doc_embedding['model']}")
+                # Untagged records from before model tagging surface here as a shape mismatch
+                similarity = self.top_k_similarity(doc_embedding['embeddings'], answer_embedding,
+                                                   self.score_top_k, doc_embedding.get('norms'))
+            except ValueError as e:
+                print(f"Document {doc_id} can't be scored with {self.embedder.model} ({e}); re-ingest it")
+                return 0
 
         score = int(similarity * 100)
         return score
 
+    @staticmethod
+    def top_k_similarity(chunk_embeddings, query_embedding, k=1, chunk_norms=None):
+        """Mean cosine similarity between the query and its k closest document chunks."""
+        import numpy as np
+        # Documents stored before per-chunk embeddings hold a single vector; treat it as one chunk
+        chunks = np.atleast_2d(np.asarray(chunk_embeddings, dtype=np.float32))
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if chunk_norms is None:
+            chunk_norms = np.linalg.norm(chunks, axis=1)
+
+        similarities = (chunks @ query) / (chunk_norms * np.linalg.norm(query))
+        k = min(k, len(similarities))
+        return float(np.mean(np.partition(similarities, -k)[-k:]))
+
     async def save_chat_history(self, doc_id, role, content):
         chat_entry = {
             "document_id": doc_id,
@@ -145,105 +496,121 @@ class PDFProcessingWorkflow:
             "content": content,
             "timestamp": datetime.utcnow()
         }
-        await asyncio.to_thread(self.mongo_ops.insert_chat_history, chat_entry)
+        # Buffered; the history reads flush pending entries before they query
+        self.mongo_ops.buffer_chat_history(chat_entry)
+        # Any prefetched follow-up questions were built from the old history
+        self.history_versions[doc_id] = self.history_versions.get(doc_id, 0) + 1
+        self.discard_prefetch(doc_id)
 
     async def get_chat_history(self, doc_id):
-        return await asyncio.to_thread(self.mongo_ops.get_chat_history, doc_id)
+        return await self.mongo_ops.get_chat_history(doc_id)
+
+    def prefetch_more_questions(self, doc_id):
+        """Start building the next question batch in the background unless a fresh one is pending."""
+        version = self.history_versions.get(doc_id, 0)
+        slot = self.prefetched_questions.get(doc_id)
+        if slot and slot[1] == version:
+            return
+        self.discard_prefetch(doc_id)
+        task = asyncio.create_task(self.build_more_questions(doc_id))
+        # Retrieve the exception of a discarded failed prefetch so it isn't reported as unhandled
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.prefetched_questions[doc_id] = (task, version)
+
+    def discard_prefetch(self, doc_id):
+        slot = self.prefetched_questions.pop(doc_id, None)
+        if slot:
+            slot[0].cancel()
+
+    async def stream_more_questions(self, doc_id, fresh=False):
+        """Yield the next question batch, from a valid prefetch if one exists, else as Gemini streams it."""
+        new_questions = []
+        slot = self.prefetched_questions.pop(doc_id, None)
+        if slot and slot[1] == self.history_versions.get(doc_id, 0) and not fresh:
+            try:
+                new_questions = await slot[0]
+            except Exception as e:
+                print(f"Prefetched questions unavailable, regenerating: {e}")
+            for question in new_questions:
+                yield question
+        elif slot:
+            slot[0].cancel()
+        if not new_questions:
+            prompt = await self.build_more_questions_prompt(doc_id)
+            async for question in self.stream_lines(prompt, fresh):
+                new_questions.append(question)
+                yield question
 
-    async def generate_more_questions(self, doc_id):
-        chat_history = await self.get_chat_history(doc_id)
-        
-        prompt = "Based on the following chat history and document content, generate 5 new questions to further test the reader's understanding:\n\n"
-        for entry in chat_history:
-            prompt += f"{entry['role'].capitalize()}: {entry['content']}\n"
-        
-        doc_content = await asyncio.to_thread(self.mongo_ops.get_document_content, doc_id)
-        prompt += f"\nDocument content: {doc_content[:2000]}..."
-        
-        response = await asyncio.to_thread(self.model.generate_content, prompt)
-        new_questions = response.text.strip().split('\n')
-        
         await self.save_chat_history(doc_id, "system", new_questions)
-        
-        return new_questions
+        self.build_question_references(doc_id, new_questions)
+
+    async def generate_more_questions(self, doc_id, fresh=False):
+        return [question async for question in self.stream_more_questions(doc_id, fresh)]
+
+    async def build_more_questions(self, doc_id, fresh=False):
+        """Generate a follow-up batch from the current history without recording it."""
+        prompt = await self.build_more_questions_prompt(doc_id)
+        return [line async for line in self.stream_lines(prompt, fresh)]
+
+    async def build_more_questions_prompt(self, doc_id):
+        """
+        Prompt for the next follow-up batch: a token-bounded history context (summary of
+        older turns plus the recent ones) and the start of the document. A cached response
+        is reused only when that context matches exactly.
+        """
+        context, doc_content = await asyncio.gather(
+            self.prompt_context.build(doc_id),
+            self.mongo_ops.get_document_content(doc_id)
+        )
+        return ("Based on the following chat history and document content, generate 5 new questions to further test the reader's understanding:\n\n"
+                f"{context}\n\nDocument content: {doc_content[:2000]}...")
 
 class MicStream:
-    SILENCE_THRESHOLD = 300  # Lowered threshold for better sensitivity
-    SILENCE_DURATION = 10  # Reduced silence duration to 2 seconds
+    SAMPLE_RATE = 16000
+    BLOCK_SIZE = 1024
+    SPEECH_THRESHOLD = 500  # RMS level that starts an utterance
+    SILENCE_THRESHOLD = 300  # RMS level the voice has to drop below to count as silence
+    HANGOVER_SECONDS = 1.0  # Silence needed after speech before the utterance ends
+    MIN_RECORDING_SECONDS = 3
+    SILENCE_DURATION = 10  # Give up after this long without any speech
 
-    @staticmethod
-    def is_silent(audio_chunk):
-        audio_data = np.frombuffer(audio_chunk, dtype=np.int16)
-        rms = np.sqrt(np.mean(np.square(audio_data)))
-        return rms < MicStream.SILENCE_THRESHOLD
+    def __init__(self):
+        from voice_activity import VoiceActivityDetector
+        self.vad = VoiceActivityDetector(
+            sample_rate=self.SAMPLE_RATE,
+            start_threshold=self.SPEECH_THRESHOLD,
+            stop_threshold=self.SILENCE_THRESHOLD,
+            hangover_seconds=self.HANGOVER_SECONDS,
+            min_duration_seconds=self.MIN_RECORDING_SECONDS,
+            no_speech_timeout_seconds=self.SILENCE_DURATION
+        )
 
     async def mic_stream(self):
-        loop = asyncio.get_event_loop()
+        """
+        Yield (chunk, status) for each captured block until the voice activity detector
+        reports the end of the utterance. Each block is evaluated once; consumers read the
+        decision from self.vad instead of re-measuring the audio.
+        """
+        loop = asyncio.get_running_loop()
         input_queue = asyncio.Queue()
-        silent_chunks = 0
-        last_audio_time = time.time()
 
         def callback(indata, frame_count, time_info, status):
+            # PortAudio reuses indata after the callback returns, so this is the one copy each block
             loop.call_soon_threadsafe(input_queue.put_nowait, (bytes(indata), status))
 
+        import sounddevice
         stream = sounddevice.RawInputStream(
-            channels=1, samplerate=16000, callback=callback, blocksize=1024, dtype="int16")
-        
-        with stream:
-            while True:
-                indata, status = await input_queue.get()
-                yield indata, status
-
-                if self.is_silent(indata):
-                    silent_chunks += 1
-                    if silent_chunks >= (self.SILENCE_DURATION * 16):  # 16 chunks per second
-                        if time.time() - last_audio_time > self.SILENCE_DURATION:
-                            break
-                else:
-                    silent_chunks = 0
-                    last_audio_time = time.time()
-
-
-    async def mic_stream(self):
-        loop = asyncio.get_event_loop()
-        input_queue = asyncio.Queue()
-        silent_chunks = 0
-        last_audio_time = time.time()
+            channels=1, samplerate=self.SAMPLE_RATE, callback=callback,
+            blocksize=self.BLOCK_SIZE, dtype="int16")
 
-        def callback(indata, frame_count, time_info, status):
-            loop.call_soon_threadsafe(input_queue.put_nowait, (bytes(indata), status))
-
-        stream = sounddevice.RawInputStream(
-            channels=1, samplerate=16000, callback=callback, blocksize=1024, dtype="int16")
-        
+        self.vad.reset()
         with stream:
             while True:
                 indata, status = await input_queue.get()
+                ended = self.vad.update(indata)
                 yield indata, status
-
-                if self.is_silent(indata):
-                    silent_chunks += 1
-                    if silent_chunks >= (self.SILENCE_DURATION * 16):  # 16 chunks per second
-                        if time.time() - last_audio_time > self.SILENCE_DURATION:
-                            break
-                else:
-                    silent_chunks = 0
-                    last_audio_time = time.time()
-
-class TranscriptHandler(TranscriptResultStreamHandler):
-    def __init__(self, stream):
-        super().__init__(stream)
-        self.transcript = []
-
-    async def handle_transcript_event(self, transcript_event: TranscriptEvent):
-        results = transcript_event.transcript.results
-        for result in results:
-            if not result.is_partial:
-                for alt in result.alternatives:
-                    self.transcript.append(alt.transcript)
-
-    def get_transcript(self):
-        return ' '.join(self.transcript)
+                if ended:
+                    break
 
 if __name__ == "__main__":
     workflow = PDFProcessingWorkflow()
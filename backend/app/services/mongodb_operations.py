@@ -1,13 +1,165 @@
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, IndexModel, ASCENDING
 from dotenv import load_dotenv
-from datetime import datetime
-from pymongo.errors import ConnectionFailure
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure, PyMongoError
 import unittest
-from bson import ObjectId
+import logging
+import threading
+import numpy as np
+from bson import ObjectId, Binary
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # or "float16"
+
+# Indexes required by the query paths, per collection
+INDEXES = {
+    # get_chat_history / get_recent_chat_history: equality on document_id, ordered by timestamp
+    "chat_history": [IndexModel([("document_id", ASCENDING), ("timestamp", ASCENDING)])],
+    # get_embedding / insert_or_update_embedding upsert: one record per document
+    "embeddings": [IndexModel([("document_id", ASCENDING)], unique=True)],
+    "evaluations": [IndexModel([("document_id", ASCENDING), ("timestamp", ASCENDING)])],
+    # trim_embedding_cache evicts in last_used order
+    "embedding_cache": [IndexModel([("last_used", ASCENDING)])],
+    # Mongo drops LLM responses once expires_at passes; trim_llm_cache evicts by last_used
+    "llm_cache": [IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+                  IndexModel([("last_used", ASCENDING)])],
+}
+
+def ingest_cache_key(content_hash, model):
+    """Ingest-cache records are per embedding model; vectors from another model can't be replayed."""
+    return f"{model}:{content_hash}"
+
+def pack_embeddings(embeddings, dtype=EMBEDDING_STORAGE_DTYPE):
+    """
+    Pack a chunk-embedding matrix into BSON binary fields, with per-row L2 norms
+    precomputed in float32 so scoring doesn't have to recompute them.
+    """
+    if embeddings is None:
+        return {"embeddings": None}
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=dtype))
+    norms = np.linalg.norm(matrix.astype(np.float32), axis=1)
+    return {
+        "embeddings": Binary(matrix.tobytes()),
+        "dtype": matrix.dtype.str,
+        "shape": list(matrix.shape),
+        "norms": Binary(norms.astype(np.float32).tobytes())
+    }
+
+def unpack_embeddings(record):
+    """
+    Decode packed embedding fields in place as read-only NumPy views over the BSON bytes.
+    Records stored before packing keep their array-of-doubles form.
+    """
+    if record and isinstance(record.get("embeddings"), bytes):
+        record["embeddings"] = np.frombuffer(record["embeddings"], dtype=record["dtype"]).reshape(record["shape"])
+        if isinstance(record.get("norms"), bytes):
+            record["norms"] = np.frombuffer(record["norms"], dtype=np.float32)
+    return record
+
+def unwritten_records(records, error, ordered=True):
+    """
+    The records of a failed insert_many that still need writing. insert_many assigns each
+    record its _id in place, so a duplicate-key error on a retry means that record landed
+    on an earlier attempt. An ordered insert stops at its first error: everything before it
+    landed and everything after it was never tried. An unordered insert tries every record.
+    """
+    if isinstance(error, BulkWriteError):
+        write_errors = error.details.get("writeErrors") or []
+        if not write_errors:
+            return records[error.details.get("nInserted", 0):]
+        failed = [e["index"] for e in write_errors if e.get("code") != 11000]
+        if ordered:
+            stopped_at = write_errors[0]["index"]
+            return [records[i] for i in failed if i == stopped_at] + records[stopped_at + 1:]
+        return [records[i] for i in failed]
+    return records
+
+def retry_later(pending, failures, max_retries, name, records, error):
+    """Put a failed batch back at the front of its collection's queue, or drop it after max_retries."""
+    if not records:
+        # Only duplicates of records that landed earlier; nothing failed
+        failures.pop(name, None)
+        return
+    attempts = failures.get(name, 0) + 1
+    if attempts > max_retries:
+        failures.pop(name, None)
+        logger.error("Dropping %d buffered writes to %s after %d failed flushes: %s",
+                     len(records), name, attempts, error)
+        return
+    failures[name] = attempts
+    pending[name] = records + pending.get(name, [])
+    logger.error("Failed to flush %d buffered writes to %s (attempt %d of %d), will retry: %s",
+                 len(records), name, attempts, max_retries, error)
+
+class WriteBehindBuffer:
+    """
+    Groups inserts per collection and writes them with ordered insert_many batches.
+    A background thread flushes every flush_interval seconds, or as soon as a collection
+    has max_batch_size records pending; flush() and close() write everything immediately.
+    Records from a failed write go back to the front of the queue and are retried, unordered,
+    on later flushes; a collection's records are only dropped (and logged) after max_retries
+    failures. Duplicate-key errors on a retry are records that already landed, not failures.
+    """
+    def __init__(self, db, max_batch_size=100, flush_interval=1.0, max_retries=3):
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.pending = {}  # collection name -> records in insertion order
+        self.failures = {}  # collection name -> consecutive failed flushes
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush at a time keeps batches in order
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.flusher = threading.Thread(target=self._run, daemon=True)
+        self.flusher.start()
+
+    def add(self, collection_name, record):
+        with self.lock:
+            records = self.pending.setdefault(collection_name, [])
+            records.append(record)
+            full = len(records) >= self.max_batch_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self, collection_name=None):
+        with self.flush_lock:
+            with self.lock:
+                if collection_name is None:
+                    batches, self.pending = self.pending, {}
+                else:
+                    batches = {collection_name: self.pending.pop(collection_name, [])}
+            for name, records in batches.items():
+                if not records:
+                    continue
+                # A retry may include records that already landed; unordered, the rest still go in
+                ordered = name not in self.failures
+                try:
+                    self.db[name].insert_many(records, ordered=ordered)
+                    self.failures.pop(name, None)
+                except PyMongoError as e:
+                    with self.lock:
+                        retry_later(self.pending, self.failures, self.max_retries,
+                                    name, unwritten_records(records, e, ordered), e)
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.flusher.join()
+        # Each failed attempt counts towards max_retries, so this ends once records land or are dropped
+        while self.pending:
+            self.flush()
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
 class MongoDBOperations:
     def __init__(self):
         load_dotenv()
@@ -19,6 +171,27 @@ class MongoDBOperations:
         self.evaluations = self.db['evaluations']
         self.embeddings = self.db['embeddings']
         self.chat_history = self.db['chat_history']
+        self.chat_summaries = self.db['chat_summaries']
+        self.question_references = self.db['question_references']
+        self.ingest_cache = self.db['ingest_cache']
+        self.embedding_cache = self.db['embedding_cache']
+        self.llm_cache = self.db['llm_cache']
+        self.write_buffer = WriteBehindBuffer(
+            self.db,
+            max_batch_size=int(os.getenv("MONGODB_WRITE_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("MONGODB_WRITE_FLUSH_INTERVAL", "1.0"))
+        )
+
+    def ensure_indexes(self):
+        """
+        Create the indexes the query paths rely on. create_indexes is a no-op for indexes
+        that already exist, so this is safe to call on every startup.
+        """
+        for name, models in INDEXES.items():
+            try:
+                self.db[name].create_indexes(models)
+            except OperationFailure as e:
+                print(f"Error creating indexes on {name}: {e}")
 
     def test_connection(self):
         try:
@@ -62,26 +235,52 @@ class MongoDBOperations:
             "timestamp": datetime.utcnow()
         }).inserted_id
 
-    def insert_or_update_embedding(self, document_id, embeddings, text):
+    def buffer_evaluation(self, user_id, document_id, score):
+        """Queue an evaluation for the next batched write instead of inserting it now."""
+        self.write_buffer.add(self.evaluations.name, {
+            "user_id": user_id,
+            "document_id": document_id,
+            "score": score,
+            "timestamp": datetime.utcnow()
+        })
+
+    def insert_or_update_embedding(self, document_id, embeddings, text, model=None):
+        """
+        Store a document's chunk embeddings as a matrix (a list with one vector per chunk),
+        tagged with the embedding model that produced them.
+        """
         return self.embeddings.update_one(
             {"document_id": ObjectId(document_id)},
             {"$set": {
-                "embeddings": embeddings,
+                **pack_embeddings(embeddings),
+                "model": model,
                 "text": text,
                 "updated_at": datetime.utcnow()
             }},
             upsert=True
         ).upserted_id
 
-    def get_embedding(self, document_id):
-        return self.embeddings.find_one({"document_id": ObjectId(document_id)})
+    def get_embedding(self, document_id, include_text=False):
+        # The full document text sits next to the vectors; leave it on the server unless asked for
+        projection = None if include_text else {"text": 0}
+        return unpack_embeddings(self.embeddings.find_one({"document_id": ObjectId(document_id)}, projection))
     
+    def iter_embeddings(self, model=None):
+        """
+        Stream every stored chunk matrix, leaving the document text on the server. Given a
+        model, only its vectors (and untagged ones stored before tagging) are returned.
+        """
+        query = {} if model is None else {"model": {"$in": [model, None]}}
+        projection = {"document_id": 1, "embeddings": 1, "dtype": 1, "shape": 1, "model": 1}
+        for record in self.embeddings.find(query, projection):
+            yield unpack_embeddings(record)
+
     def get_document_content(self, doc_id):
         """
         Retrieve the content of a document by its MongoDB ObjectID.
         """
         try:
-            document = self.documents.find_one({"_id": ObjectId(doc_id)})
+            document = self.documents.find_one({"_id": ObjectId(doc_id)}, {"content": 1})
             if document:
                 return document.get("content", "")  # Assuming the content is stored in a 'content' field
             else:
@@ -93,10 +292,144 @@ class MongoDBOperations:
     def insert_chat_history(self, chat_entry):
         return self.chat_history.insert_one(chat_entry).inserted_id
 
+    def buffer_chat_history(self, chat_entry):
+        """Queue a chat-history entry for the next batched write instead of inserting it now."""
+        self.write_buffer.add(self.chat_history.name, chat_entry)
+
+    def flush_writes(self):
+        self.write_buffer.flush()
+
     def get_chat_history(self, doc_id):
-        return list(self.chat_history.find({"document_id": ObjectId(doc_id)}).sort("timestamp", 1))
+        # Read-your-writes: anything still buffered has to land before we query
+        self.write_buffer.flush(self.chat_history.name)
+        projection = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        return list(self.chat_history.find({"document_id": ObjectId(doc_id)}, projection).sort("timestamp", 1))
+    
+    def get_recent_chat_history(self, doc_id, after=None, limit=None):
+        """
+        The newest entries (at most limit) written after the given timestamp, oldest first.
+        Reads the suffix of the history from the (document_id, timestamp) index.
+        """
+        self.write_buffer.flush(self.chat_history.name)
+        query = {"document_id": ObjectId(doc_id)}
+        if after is not None:
+            query["timestamp"] = {"$gt": after}
+        projection = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        cursor = self.chat_history.find(query, projection).sort("timestamp", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)[::-1]
+    
+    def get_chat_summary(self, doc_id):
+        return self.chat_summaries.find_one({"_id": ObjectId(doc_id)})
+
+    def save_chat_summary(self, doc_id, summary, covered_until):
+        """Store the running summary of every chat-history entry up to covered_until."""
+        self.chat_summaries.update_one(
+            {"_id": ObjectId(doc_id)},
+            {"$set": {
+                "summary": summary,
+                "covered_until": covered_until,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
     
+    def get_question_references(self, doc_id):
+        return unpack_embeddings(self.question_references.find_one({"_id": ObjectId(doc_id)}))
+
+    def save_question_references(self, doc_id, questions, embeddings, model=None):
+        """Store the generated questions with one reference vector per question."""
+        self.question_references.update_one(
+            {"_id": ObjectId(doc_id)},
+            {"$set": {
+                "questions": questions,
+                **pack_embeddings(embeddings),
+                "model": model,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    
+    def get_ingest_cache(self, content_hash, model):
+        """Look up the extracted text, embeddings and questions for previously ingested PDF bytes."""
+        return unpack_embeddings(self.ingest_cache.find_one({"_id": ingest_cache_key(content_hash, model)}))
+
+    def save_ingest_cache(self, content_hash, text, embeddings, questions, model):
+        """Only complete ingests belong here; process_pdf skips the save when any chunk failed."""
+        return self.ingest_cache.update_one(
+            {"_id": ingest_cache_key(content_hash, model)},
+            {"$set": {
+                "model": model,
+                "text": text,
+                **pack_embeddings(embeddings),
+                "questions": questions,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        ).upserted_id
+
+    def get_cached_embeddings(self, keys):
+        """Return {key: embedding} for cached keys, refreshing their last-used time."""
+        found = {entry["_id"]: entry["embedding"]
+                 for entry in self.embedding_cache.find({"_id": {"$in": keys}}, {"embedding": 1})}
+        if found:
+            self.embedding_cache.update_many(
+                {"_id": {"$in": list(found)}},
+                {"$set": {"last_used": datetime.utcnow()}}
+            )
+        return found
+
+    def save_cached_embeddings(self, items):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"_id": key}, {"$set": {"embedding": embedding, "last_used": now}}, upsert=True)
+            for key, embedding in items.items()
+        ]
+        if operations:
+            self.embedding_cache.bulk_write(operations, ordered=False)
+
+    def trim_embedding_cache(self, max_entries):
+        """Evict the least recently used cached embeddings beyond max_entries."""
+        excess = self.embedding_cache.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = [entry["_id"] for entry in
+                     self.embedding_cache.find({}, {"_id": 1}).sort("last_used", 1).limit(excess)]
+        return self.embedding_cache.delete_many({"_id": {"$in": stale_ids}}).deleted_count
+
+    def get_llm_response(self, key):
+        """Return the unexpired cached LLM response record for key, refreshing its last-used time."""
+        return self.llm_cache.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+            {"$set": {"last_used": datetime.utcnow()}},
+            projection={"response": 1, "expires_at": 1}
+        )
+
+    def save_llm_response(self, key, model, response, ttl_seconds):
+        now = datetime.utcnow()
+        self.llm_cache.update_one(
+            {"_id": key},
+            {"$set": {
+                "model": model,
+                "response": response,
+                "last_used": now,
+                "expires_at": now + timedelta(seconds=ttl_seconds)
+            }},
+            upsert=True
+        )
+
+    def trim_llm_cache(self, max_entries):
+        """Evict the least recently used cached LLM responses beyond max_entries."""
+        excess = self.llm_cache.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = [entry["_id"] for entry in
+                     self.llm_cache.find({}, {"_id": 1}).sort("last_used", 1).limit(excess)]
+        return self.llm_cache.delete_many({"_id": {"$in": stale_ids}}).deleted_count
+
     def close_connection(self):
+        self.write_buffer.close()
         self.client.close()
 
 class TestMongoDBConnection(unittest.TestCase):
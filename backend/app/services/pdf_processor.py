@@ -1,22 +1,107 @@
 import PyPDF2
 import io
+import os
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+_worker_reader = None  # The PDF each extraction worker process parses once, in _init_worker
+
+def _init_worker(pdf_path):
+    """
+    Pool initializer: each worker opens the PDF once and keeps one reader for every page
+    range it is given, rather than a parse per task.
+    """
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(pdf_path)
+
+def _extract_page_range(start, stop):
+    """Extract text from pages [start, stop) of the worker's PDF."""
+    return [(page_number, _worker_reader.pages[page_number].extract_text() or "")
+            for page_number in range(start, stop)]
 
 class PDFProcessor:
+    PAGES_PER_TASK = 16  # Pages handed to a worker process at a time
+
     @staticmethod
-    def extract_text(pdf_file):
+    def iter_pages(pdf_file, workers=None, spool_dir=None):
+        """
+        Yield (page_number, text) for each page of a PDF as soon as it is extracted.
+
+        :param pdf_file: A path or file-like object containing the PDF data
+        :param workers: Number of worker processes to spread pages across. None or 1
+                        extracts serially in the calling process.
+        :param spool_dir: Where a file object is copied for the workers to open; None uses
+                          the default temp directory
+        """
+        if not workers or workers <= 1:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            for page_number, page in enumerate(pdf_reader.pages):
+                yield page_number, page.extract_text() or ""
+            return
+
+        if isinstance(pdf_file, (str, os.PathLike)):
+            yield from PDFProcessor._iter_pages_in_pool(os.fspath(pdf_file), workers)
+            return
+
+        # Workers can't share an open file handle; copying block by block to a named file
+        # keeps a large spooled download out of this process's memory
+        with tempfile.NamedTemporaryFile(suffix=".pdf", dir=spool_dir) as spooled:
+            pdf_file.seek(0)
+            shutil.copyfileobj(pdf_file, spooled)
+            spooled.flush()
+            yield from PDFProcessor._iter_pages_in_pool(spooled.name, workers)
+
+    @staticmethod
+    def _iter_pages_in_pool(pdf_path, workers):
+        page_count = len(PyPDF2.PdfReader(pdf_path).pages)
+        step = PDFProcessor.PAGES_PER_TASK
+        # No more workers than page ranges, since each one parses the whole PDF up front
+        workers = min(workers, max(1, -(-page_count // step)))
+        starts = list(range(0, page_count, step))
+        stops = [min(start + step, page_count) for start in starts]
+
+        # Forking copies whatever locks the caller's other threads (Mongo, HTTP clients) hold
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                                 initializer=_init_worker, initargs=(pdf_path,)) as executor:
+            # map() keeps page order while later ranges are still being extracted
+            for pages in executor.map(_extract_page_range, starts, stops):
+                yield from pages
+
+    @staticmethod
+    def extract_text(pdf_file, workers=None, spool_dir=None):
         """
         Extract text from a PDF file.
         """
-        text = ""
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
+            text = "\n".join(page_text for _, page_text in PDFProcessor.iter_pages(pdf_file, workers, spool_dir))
         except Exception as e:
             print(f"Error extracting text from PDF: {str(e)}")
             return None
         return text.strip()
 
+    @staticmethod
+    def content_hash(pdf_file, block_size=1024 * 1024):
+        """
+        Compute the SHA-256 hex digest of a PDF's raw bytes.
+
+        :param pdf_file: A path or seekable file-like object; file objects are rewound afterwards
+        """
+        digest = hashlib.sha256()
+        if isinstance(pdf_file, (str, os.PathLike)):
+            with open(pdf_file, 'rb') as f:
+                for block in iter(lambda: f.read(block_size), b""):
+                    digest.update(block)
+        else:
+            pdf_file.seek(0)
+            for block in iter(lambda: pdf_file.read(block_size), b""):
+                digest.update(block)
+            pdf_file.seek(0)
+        return digest.hexdigest()
+
     @staticmethod
     def get_page_count(pdf_file):
         """
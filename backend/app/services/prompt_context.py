@@ -0,0 +1,91 @@
+import asyncio
+from embedding_cache import call_store
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a study session. Keep the topics covered, the questions "
+    "already asked, and where the learner's answers were strong or weak. Reply with the "
+    "summary only, in at most {max_words} words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New turns:\n{turns}"
+)
+
+class PromptContextBuilder:
+    """
+    Chat-history context for follow-up prompts, bounded to max_tokens. The newest turns are
+    kept verbatim in a rolling window; older turns are folded into a per-document summary
+    stored in Mongo, which moves forward as turns leave the window. Only history written
+    after the summary's high-water mark is read.
+    """
+    def __init__(self, mongo_ops, summarize, tokenizer, max_tokens=3000, summary_tokens=500,
+                 max_unsummarized_turns=200):
+        if summary_tokens >= max_tokens:
+            raise ValueError("summary_tokens must be smaller than max_tokens")
+        self.mongo_ops = mongo_ops
+        self.summarize = summarize  # async (prompt) -> text
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        # Caps the read for histories that predate the summary (only the newest turns are kept)
+        self.max_unsummarized_turns = max_unsummarized_turns
+        self.locks = {}  # doc_id -> lock, so concurrent builds don't summarize the same turns twice
+
+    async def build(self, doc_id):
+        """Return the context text: the stored summary followed by the recent turns."""
+        lock = self.locks.setdefault(doc_id, asyncio.Lock())
+        async with lock:
+            state = await call_store(self.mongo_ops, "get_chat_summary", doc_id) or {}
+            summary = state.get("summary", "")
+            turns = await call_store(self.mongo_ops, "get_recent_chat_history", doc_id,
+                                     state.get("covered_until"), self.max_unsummarized_turns)
+
+            window = self.recent_window(turns, self.max_tokens - self.count_tokens(summary))
+            if len(window) < len(turns):
+                # Leave room for the summary at its full size, then fold in what doesn't fit
+                window = self.recent_window(turns, self.max_tokens - self.summary_tokens)
+                older = turns[:len(turns) - len(window)]
+                summary = await self.update_summary(summary, older)
+                await call_store(self.mongo_ops, "save_chat_summary", doc_id, summary, older[-1]["timestamp"])
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier turns: {summary}\n")
+        parts.extend(self.format_turn(turn) for turn in window)
+        return "\n".join(parts)
+
+    def recent_window(self, turns, budget):
+        """The longest suffix of turns whose formatted text fits in budget tokens."""
+        used, start = 0, len(turns)
+        for turn in reversed(turns):
+            used += self.count_tokens(self.format_turn(turn))
+            if used > budget:
+                break
+            start -= 1
+        # The newest turn always stays verbatim; format_turn's output is cut to fit if needed
+        if start == len(turns) and turns:
+            start -= 1
+        return turns[start:]
+
+    async def update_summary(self, summary, turns):
+        prompt = SUMMARY_PROMPT.format(
+            # Roughly 0.75 words per token leaves headroom below summary_tokens
+            max_words=int(self.summary_tokens * 0.75),
+            summary=summary or "(none)",
+            turns="\n".join(self.format_turn(turn) for turn in turns)
+        )
+        updated = (await self.summarize(prompt)).strip()
+        return self.truncate(updated, self.summary_tokens)
+
+    def format_turn(self, turn):
+        content = turn['content']
+        if isinstance(content, list):
+            content = " ".join(content)
+        return self.truncate(f"{turn['role'].capitalize()}: {content}", self.max_tokens - self.summary_tokens)
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text)) if text else 0
+
+    def truncate(self, text, max_tokens):
+        tokens = self.tokenizer.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.tokenizer.decode(tokens[:max_tokens])
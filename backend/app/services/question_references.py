@@ -0,0 +1,82 @@
+import numpy as np
+from embedding_cache import call_store
+
+def _normalize(matrix):
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class QuestionReferenceIndex:
+    """
+    Per-document reference vectors for answer scoring, one per generated question.
+
+    A question's reference is the normalized sum of its own embedding and the embedding of
+    the document chunk that best supports it, so an answer scores well when it addresses
+    the question with the document's content. References are built when questions are
+    generated, kept in memory and persisted to Mongo; scoring an answer is then a single
+    matrix-vector product with no database read once the document has been seen.
+    """
+    def __init__(self, mongo_ops, embedder):
+        self.mongo_ops = mongo_ops
+        self.embedder = embedder
+        self.references = {}  # doc_id -> (questions, unit reference matrix)
+        self.chunks = {}  # doc_id -> unit chunk matrix, or None for documents without embeddings
+
+    async def add(self, doc_id, questions, chunk_embeddings=None):
+        """Build references for newly generated questions; chunk_embeddings skips the Mongo read."""
+        questions = [question for question in questions if question]
+        if not questions:
+            return
+
+        if chunk_embeddings is not None:
+            self.chunks[doc_id] = _normalize(chunk_embeddings)
+        elif doc_id not in self.chunks:
+            record = await call_store(self.mongo_ops, "get_embedding", doc_id)
+            stored = (record or {}).get("embeddings")
+            if stored is not None and self._same_model(record):
+                self.chunks[doc_id] = _normalize(stored)
+            else:
+                self.chunks[doc_id] = None
+
+        embeddings = await self.embedder.agenerate_embeddings(questions)
+        embedded = [(question, e) for question, e in zip(questions, embeddings) if e]
+        if not embedded:
+            return
+        references = _normalize([e for _, e in embedded])
+
+        chunks = self.chunks[doc_id]
+        # Untagged chunks from before model tagging may still come from a different model
+        if chunks is not None and chunks.shape[1] == references.shape[1]:
+            supporting = chunks[np.argmax(references @ chunks.T, axis=1)]
+            references = _normalize(references + supporting)
+
+        known_questions, known = self.references.get(doc_id) or await self._load(doc_id)
+        if known is not None and known.shape[1] != references.shape[1]:
+            known_questions, known = [], None
+        all_questions = known_questions + [question for question, _ in embedded]
+        matrix = references if known is None else np.vstack([known, references])
+        self.references[doc_id] = (all_questions, matrix)
+        await call_store(self.mongo_ops, "save_question_references", doc_id, all_questions, matrix,
+                         self.embedder.model)
+
+    async def score(self, doc_id, answer_embedding):
+        """Cosine similarity between the answer and the reference it matches best, or None."""
+        entry = self.references.get(doc_id)
+        if entry is None:
+            # Remembered even when empty, so a document without references is looked up once
+            entry = self.references[doc_id] = await self._load(doc_id)
+        answer = _normalize(answer_embedding)[0]
+        if entry[1] is None or entry[1].shape[1] != len(answer):
+            return None
+        return float(np.max(entry[1] @ answer))
+
+    async def _load(self, doc_id):
+        # Only documents generated in an earlier process reach Mongo here
+        record = await call_store(self.mongo_ops, "get_question_references", doc_id)
+        if not record or record.get("embeddings") is None or not self._same_model(record):
+            return [], None
+        return list(record["questions"]), _normalize(record["embeddings"])
+
+    def _same_model(self, record):
+        # Records stored before model tagging have no model field; the dimension check catches those
+        return record.get("model") in (None, self.embedder.model)
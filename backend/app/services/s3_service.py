@@ -1,8 +1,14 @@
 # app/services/s3_service.py
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import os
 import logging
+import queue
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,24 +16,48 @@ load_dotenv()
 AWS_ACCESS_KEY_ID=os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY=os.getenv("AWS_SECRET_ACCESS_KEY")
 S3_BUCKET_NAME=os.getenv("S3_BUCKET_NAME")
+S3_SPOOL_MAX_BYTES=int(os.getenv("S3_SPOOL_MAX_BYTES", str(64 * 1024 * 1024)))
+# Large downloads spill here rather than to the default tempdir, which is often a small
+# tmpfs /tmp in containers; /var/tmp is disk-backed. None falls back to the default.
+S3_SPOOL_DIR=os.getenv("S3_SPOOL_DIR", "/var/tmp")
+if not os.path.isdir(S3_SPOOL_DIR):
+    S3_SPOOL_DIR=None
+CONTENT_HASH_METADATA_KEY="content-sha256"
+S3_MULTIPART_THRESHOLD=int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE=int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(16 * 1024 * 1024)))
+S3_MAX_CONCURRENCY=int(os.getenv("S3_MAX_CONCURRENCY", "10"))
 
 class S3Service:
-    def __init__(self, bucket_name=S3_BUCKET_NAME, aws_access_key_id=AWS_ACCESS_KEY_ID, aws_secret_access_key=AWS_SECRET_ACCESS_KEY, region_name='us-east-1'):
+    CONTENT_HASH_METADATA_KEY = CONTENT_HASH_METADATA_KEY
+
+    def __init__(self, bucket_name=S3_BUCKET_NAME, aws_access_key_id=AWS_ACCESS_KEY_ID, aws_secret_access_key=AWS_SECRET_ACCESS_KEY, region_name='us-east-1',
+                 multipart_threshold=S3_MULTIPART_THRESHOLD, multipart_chunksize=S3_MULTIPART_CHUNKSIZE, max_concurrency=S3_MAX_CONCURRENCY):
         self.bucket_name = bucket_name
         self.s3 = boto3.client('s3',
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name
+            region_name=region_name,
+            # Enough pooled connections for every concurrent part transfer
+            config=Config(max_pool_connections=max(max_concurrency, 10))
+        )
+        # Objects above multipart_threshold move as parallel parts of multipart_chunksize
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
         )
         self.logger = logging.getLogger(__name__)
 
-    def upload_file(self, file_path, object_name=None):
-        """Upload a file to S3 bucket"""
+    def upload_file(self, file_path, object_name=None, metadata=None):
+        """Upload a file to S3 bucket, optionally attaching user metadata"""
         if object_name is None:
             object_name = file_path
 
         try:
-            self.s3.upload_file(file_path, self.bucket_name, object_name)
+            extra_args = {'Metadata': metadata} if metadata else None
+            self.s3.upload_file(file_path, self.bucket_name, object_name, ExtraArgs=extra_args,
+                                Config=self.transfer_config)
             self.logger.info(f"File {file_path} uploaded successfully to {self.bucket_name}/{object_name}")
             return True
         except ClientError as e:
@@ -37,12 +67,69 @@ class S3Service:
     def download_file(self, bucket_name, object_name, file_path):
         """Download a file from S3 bucket"""
         try:
-            self.s3.download_file(bucket_name, object_name, file_path)
+            self.s3.download_file(bucket_name, object_name, file_path, Config=self.transfer_config)
             self.logger.info(f"File {object_name} downloaded successfully from {bucket_name} to {file_path}")
             return True
         except ClientError as e:
             self.logger.error(f"Error downloading file from S3: {e}")
             return False
+
+    def download_fileobj(self, bucket_name, object_name, spool_max_bytes=S3_SPOOL_MAX_BYTES):
+        """
+        Download an object into a seekable in-memory buffer instead of a named file.
+        Objects larger than spool_max_bytes roll over to an anonymous temp file in
+        S3_SPOOL_DIR (default /var/tmp, not the tmpfs /tmp), so large uploads don't have
+        to fit in memory.
+        Returns the buffer positioned at the start, or None on failure.
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes, dir=S3_SPOOL_DIR)
+        try:
+            self.s3.download_fileobj(bucket_name, object_name, buffer, Config=self.transfer_config)
+            buffer.seek(0)
+            self.logger.info(f"File {object_name} downloaded successfully from {bucket_name} into memory")
+            return buffer
+        except ClientError as e:
+            buffer.close()
+            self.logger.error(f"Error downloading file from S3: {e}")
+            return None
+
+    def get_object_metadata(self, bucket_name, object_name):
+        """Fetch an object's user metadata without downloading its body"""
+        try:
+            return self.s3.head_object(Bucket=bucket_name, Key=object_name).get('Metadata', {})
+        except ClientError as e:
+            self.logger.error(f"Error fetching metadata from S3: {e}")
+            return None
+
+    def get_range(self, bucket_name, object_name, start, end=None):
+        """
+        Fetch a byte range of an object. A negative start with no end reads the last
+        -start bytes, e.g. get_range(bucket, key, -1024) for a PDF's trailer and xref.
+        Returns the bytes, or None on failure.
+        """
+        if start < 0:
+            byte_range = f"bytes={start}"
+        elif end is None:
+            byte_range = f"bytes={start}-"
+        else:
+            byte_range = f"bytes={start}-{end}"
+        try:
+            return self.s3.get_object(Bucket=bucket_name, Key=object_name, Range=byte_range)['Body'].read()
+        except ClientError as e:
+            self.logger.error(f"Error reading range {byte_range} of {object_name} from S3: {e}")
+            return None
+
+    def iter_object(self, bucket_name, object_name, chunk_size=1024 * 1024):
+        """Stream an object's body in chunk_size pieces without buffering it whole."""
+        try:
+            body = self.s3.get_object(Bucket=bucket_name, Key=object_name)['Body']
+        except ClientError as e:
+            self.logger.error(f"Error streaming {object_name} from S3: {e}")
+            return
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
     # def download_file(self, bucket_name, object_key, local_path):
     #     try:
     #         self.s3.download_file(bucket_name, object_key, local_path)
@@ -79,16 +166,94 @@ class S3Service:
             self.logger.error(f"Error deleting file from S3: {e}")
             return False
         
-    def list_files(self, prefix=''):
-        """List files in the S3 bucket"""
+    def list_files(self, prefix='', delimiter=None):
+        """List every file key under prefix in the S3 bucket (all pages, not just the first 1000)"""
         try:
-            response = self.s3.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
-            files = [obj['Key'] for obj in response.get('Contents', [])]
-            self.logger.info(f"Listed {len(files)} files from {self.bucket_name}")
-            return files
+            files = [obj['Key'] for obj in self.iter_objects(prefix, delimiter)]
+        except ClientError:
+            # Already logged by _paginate; a partial listing would look complete, so return none
+            return []
+        self.logger.info(f"Listed {len(files)} files from {self.bucket_name}")
+        return files
+
+    def iter_objects(self, prefix='', delimiter=None, page_size=1000, bucket_name=None):
+        """
+        Stream objects under prefix page by page. Yields dicts with Key, Size, ETag and
+        LastModified; with a delimiter, keys below the next delimiter are not descended into.
+        """
+        for page in self._paginate(prefix, delimiter, page_size, bucket_name):
+            for obj in page.get('Contents', []):
+                yield {
+                    'Key': obj['Key'],
+                    'Size': obj['Size'],
+                    'ETag': obj['ETag'].strip('"'),
+                    'LastModified': obj['LastModified']
+                }
+
+    def iter_prefixes(self, prefix='', delimiter='/', bucket_name=None):
+        """Stream the common prefixes ("subdirectories") directly under prefix"""
+        for page in self._paginate(prefix, delimiter, 1000, bucket_name):
+            for common_prefix in page.get('CommonPrefixes', []):
+                yield common_prefix['Prefix']
+
+    def iter_objects_parallel(self, prefixes, max_workers=8, bucket_name=None):
+        """
+        List several prefixes concurrently and yield their objects as pages arrive.
+        Order across prefixes is not preserved. A bounded queue keeps listing threads
+        from running far ahead of the consumer. An error listing any prefix is raised to
+        the consumer once the objects already listed have been yielded.
+        """
+        results = queue.Queue(maxsize=max_workers * 1000)
+        stop = threading.Event()  # Set if the consumer stops iterating early
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def list_prefix(prefix):
+            try:
+                for obj in self.iter_objects(prefix, bucket_name=bucket_name):
+                    if not put(obj):
+                        return
+            except Exception as e:
+                # Nothing reads the executor's future, so hand the error to the consumer instead
+                put(e)
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for prefix in prefixes:
+                executor.submit(list_prefix, prefix)
+            try:
+                remaining = len(prefixes)
+                while remaining:
+                    item = results.get()
+                    if item is done:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                stop.set()
+
+    def _paginate(self, prefix, delimiter, page_size, bucket_name):
+        params = {'Bucket': bucket_name or self.bucket_name, 'Prefix': prefix,
+                  'PaginationConfig': {'PageSize': page_size}}
+        if delimiter:
+            params['Delimiter'] = delimiter
+        try:
+            yield from self.s3.get_paginator('list_objects_v2').paginate(**params)
         except ClientError as e:
+            # Re-raised so a listing cut short by an error doesn't end as if it were complete
             self.logger.error(f"Error listing files from S3: {e}")
-            return []
+            raise
 ##### TESTING ######
 import os
 
@@ -0,0 +1,66 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Each sample runs in a fresh interpreter so module caches from earlier runs don't hide
+# import cost. Construction is included because clients used to be built in __init__.
+SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.PDFProcessingWorkflow()
+constructed = time.perf_counter()
+print((imported - start) * 1000, (constructed - imported) * 1000)
+"""
+
+# Modules that should never be loaded just by importing main and building the workflow
+LAZY_MODULES = ["sounddevice", "pyaudio", "boto3", "pymongo", "motor", "numpy", "tiktoken",
+                "google.generativeai", "amazon_transcribe"]
+
+def measure(runs):
+    services_dir = os.path.dirname(os.path.abspath(__file__))
+    import_times, construct_times = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", SNIPPET], cwd=services_dir,
+                                capture_output=True, text=True, check=True).stdout
+        import_ms, construct_ms = map(float, output.split())
+        import_times.append(import_ms)
+        construct_times.append(construct_ms)
+    return import_times, construct_times
+
+def eagerly_loaded_modules():
+    services_dir = os.path.dirname(os.path.abspath(__file__))
+    snippet = ("import sys, main; main.PDFProcessingWorkflow(); "
+               f"print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", snippet], cwd=services_dir,
+                            capture_output=True, text=True, check=True).stdout
+    return output.split()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the services entry point")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Exit non-zero if median import + construction time exceeds this")
+    args = parser.parse_args()
+
+    import_times, construct_times = measure(args.runs)
+    total = statistics.median(i + c for i, c in zip(import_times, construct_times))
+    print(f"import main:            median {statistics.median(import_times):.1f} ms, max {max(import_times):.1f} ms")
+    print(f"PDFProcessingWorkflow(): median {statistics.median(construct_times):.1f} ms, max {max(construct_times):.1f} ms")
+    print(f"total:                  median {total:.1f} ms over {args.runs} runs")
+
+    failed = False
+    eager = eagerly_loaded_modules()
+    if eager:
+        print(f"Heavy modules loaded at startup: {', '.join(eager)}")
+        failed = True
+    if args.max_ms is not None and total > args.max_ms:
+        print(f"Startup time {total:.1f} ms exceeds budget of {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import pickle
+import unittest
+from chunker import SENTENCE_BOUNDARY, Chunk, StreamingChunker
+
+class WhitespaceTokenizer:
+    """One token per whitespace-separated word, so token counts are easy to reason about."""
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+class TestStreamingChunker(unittest.TestCase):
+    MAX_TOKENS = 30
+    OVERLAP_TOKENS = 12
+
+    def setUp(self):
+        self.chunker = StreamingChunker(WhitespaceTokenizer(), self.MAX_TOKENS, self.OVERLAP_TOKENS)
+
+    @staticmethod
+    def sentences(count, start=0):
+        return [f"s{i} alpha beta gamma delta." for i in range(start, start + count)]
+
+    def chunk_pages(self, pages):
+        chunks = []
+        for page in pages:
+            chunks.extend(self.chunker.feed(page))
+        return chunks + self.chunker.flush()
+
+    def test_chunks_respect_max_tokens(self):
+        """No chunk may exceed max_tokens, whatever the page boundaries."""
+        pages = [" ".join(self.sentences(7, start)) for start in range(0, 70, 7)]
+        chunks = self.chunk_pages(pages)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.split()), self.MAX_TOKENS)
+
+    def test_consecutive_chunks_overlap_within_budget(self):
+        """Each chunk starts with whole sentences from the end of the previous one, up to overlap_tokens."""
+        chunks = self.chunk_pages([" ".join(self.sentences(40))])
+        self.assertGreater(len(chunks), 2)
+        for previous, current in zip(chunks, chunks[1:]):
+            previous_sentences = SENTENCE_BOUNDARY.split(previous)
+            current_sentences = SENTENCE_BOUNDARY.split(current)
+            carried = max(n for n in range(len(current_sentences))
+                          if previous_sentences[len(previous_sentences) - n:] == current_sentences[:n])
+            self.assertGreater(carried, 0)
+            # The chunker counts one extra token per sentence for the joining space
+            carried_tokens = sum(len(sentence.split()) + 1 for sentence in current_sentences[:carried])
+            self.assertLessEqual(carried_tokens, self.OVERLAP_TOKENS)
+
+    def test_every_sentence_is_kept(self):
+        sentences = self.sentences(25)
+        text = " ".join(self.chunk_pages([" ".join(sentences[:12]), " ".join(sentences[12:])]))
+        for sentence in sentences:
+            self.assertIn(sentence, text)
+
+    def test_sentence_split_across_pages(self):
+        """A sentence that continues on the next page is kept whole."""
+        chunks = self.chunk_pages(["s0 alpha beta", "gamma delta. s1 alpha beta gamma delta."])
+        self.assertEqual(chunks, ["s0 alpha beta gamma delta. s1 alpha beta gamma delta."])
+
+    def test_unpunctuated_pages_are_emitted_while_streaming(self):
+        """Text without sentence boundaries must not pile up in pending until flush()."""
+        emitted = 0
+        for page in range(5):
+            emitted += len(self.chunker.feed(" ".join(f"w{page}_{i}" for i in range(self.MAX_TOKENS))))
+            self.assertLess(len(self.chunker.pending.split()), self.MAX_TOKENS)
+        self.assertGreaterEqual(emitted, 5)
+
+    def test_long_sentence_is_hard_split(self):
+        """Windows over an over-long sentence cover every token without a redundant tail window."""
+        words = [f"w{i}" for i in range(70)]
+        chunks = self.chunk_pages([" ".join(words) + "."])
+        step = self.MAX_TOKENS - self.OVERLAP_TOKENS
+        self.assertEqual(len(chunks), len(range(0, len(words) - self.OVERLAP_TOKENS, step)))
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.split()), self.MAX_TOKENS)
+        self.assertTrue(chunks[-1].endswith("w69."))
+
+    def test_chunks_carry_token_counts(self):
+        """The count the embedder relies on covers the chunk's tokens and stays within max_tokens."""
+        words = [f"w{i}" for i in range(70)]
+        chunks = self.chunk_pages([" ".join(self.sentences(20)), " ".join(words) + "."])
+        for chunk in chunks:
+            self.assertIsInstance(chunk, Chunk)
+            self.assertGreaterEqual(chunk.token_count, len(chunk.split()))
+            self.assertLessEqual(chunk.token_count, self.MAX_TOKENS)
+        chunk = pickle.loads(pickle.dumps(chunks[0]))
+        self.assertEqual((chunk, chunk.token_count), (chunks[0], chunks[0].token_count))
+
+    def test_flush_resets_state(self):
+        self.chunk_pages([" ".join(self.sentences(3))])
+        self.assertEqual(self.chunker.flush(), [])
+        self.assertEqual(self.chunker.token_count, 0)
+        self.assertEqual(self.chunker.pending, "")
+
+    def test_overlap_must_be_smaller_than_chunk(self):
+        with self.assertRaises(ValueError):
+            StreamingChunker(WhitespaceTokenizer(), 10, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+from embedding_cache import EmbeddingCache
+
+class SyncEmbeddingStore:
+    def __init__(self, stored=None):
+        self.stored = dict(stored or {})
+        self.trims = 0
+
+    def get_cached_embeddings(self, keys):
+        return {key: self.stored[key] for key in keys if key in self.stored}
+
+    def save_cached_embeddings(self, items):
+        self.stored.update(items)
+
+    def trim_embedding_cache(self, max_entries):
+        self.trims += 1
+
+class AsyncEmbeddingStore:
+    async def get_cached_embeddings(self, keys):
+        return {}
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_memory_tier_evicts_least_recently_used(self):
+        cache = EmbeddingCache(max_entries=2)
+        cache.put_many({"a": [1.0], "b": [2.0]})
+        cache.get_many(["a"])  # "b" is now the least recently used
+        cache.put_many({"c": [3.0]})
+        self.assertEqual(list(cache.entries), ["a", "c"])
+
+    def test_hit_counters(self):
+        store = SyncEmbeddingStore({"persisted": [0.5]})
+        cache = EmbeddingCache(store)
+        cache.put_many({"memory": [1.0]})
+
+        found = cache.get_many(["memory", "persisted", "missing"])
+        self.assertEqual(found, {"memory": [1.0], "persisted": [0.5]})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["persistent_hits"], stats["misses"]), (1, 1, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+        # Persistent hits are promoted to the memory tier
+        cache.get_many(["persisted"])
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_persistent_tier_is_trimmed_periodically(self):
+        store = SyncEmbeddingStore()
+        cache = EmbeddingCache(store)
+        cache.put_many({f"k{i}": [float(i)] for i in range(EmbeddingCache.TRIM_EVERY - 1)})
+        self.assertEqual(store.trims, 0)
+        cache.put_many({"last": [0.0]})
+        self.assertEqual(store.trims, 1)
+
+    def test_async_methods_with_sync_store(self):
+        cache = EmbeddingCache(SyncEmbeddingStore({"persisted": [0.5]}))
+        found = asyncio.run(cache.aget_many(["persisted", "missing"]))
+        self.assertEqual(found, {"persisted": [0.5]})
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_blocking_methods_reject_async_store(self):
+        cache = EmbeddingCache(AsyncEmbeddingStore())
+        with self.assertRaises(TypeError):
+            cache.get_many(["a"])
+        with self.assertRaises(TypeError):
+            cache.put_many({"a": [1.0]})
+
+    def test_key_ignores_whitespace_but_not_model(self):
+        self.assertEqual(EmbeddingCache.make_key("m", "a  b\n"), EmbeddingCache.make_key("m", "a b"))
+        self.assertNotEqual(EmbeddingCache.make_key("m", "a b"), EmbeddingCache.make_key("n", "a b"))
+
+if __name__ == '__main__':
+    unittest.main()
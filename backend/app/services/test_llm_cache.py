@@ -0,0 +1,82 @@
+import time
+import asyncio
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+from llm_cache import LLMResponseCache
+
+class AsyncLLMStore:
+    def __init__(self):
+        self.stored = {}
+        self.trims = 0
+
+    async def get_llm_response(self, key):
+        record = self.stored.get(key)
+        if record is None or record["expires_at"].replace(tzinfo=timezone.utc).timestamp() <= time.time():
+            return None
+        return record
+
+    async def save_llm_response(self, key, model, response, ttl_seconds):
+        # Naive UTC, as pymongo returns it
+        expires_at = datetime.fromtimestamp(time.time() + ttl_seconds, timezone.utc).replace(tzinfo=None)
+        self.stored[key] = {"response": response, "model": model, "expires_at": expires_at}
+
+    async def trim_llm_cache(self, max_entries):
+        self.trims += 1
+
+class TestLLMResponseCache(unittest.TestCase):
+    def test_entries_expire_after_ttl(self):
+        cache = LLMResponseCache(ttl_seconds=60)
+        with mock.patch("llm_cache.time.time", return_value=1000.0):
+            asyncio.run(cache.put("k", "model", "response"))
+        with mock.patch("llm_cache.time.time", return_value=1059.0):
+            self.assertEqual(asyncio.run(cache.get("k")), "response")
+        with mock.patch("llm_cache.time.time", return_value=1061.0):
+            self.assertIsNone(asyncio.run(cache.get("k")))
+        self.assertNotIn("k", cache.entries)
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        async def run():
+            cache = LLMResponseCache(max_entries=2)
+            await cache.put("a", "model", "A")
+            await cache.put("b", "model", "B")
+            await cache.get("a")
+            await cache.put("c", "model", "C")
+            return cache
+        self.assertEqual(list(asyncio.run(run()).entries), ["a", "c"])
+
+    def test_stats_and_persistent_promotion(self):
+        async def run():
+            store = AsyncLLMStore()
+            await LLMResponseCache(store).put("k", "model", "response")
+
+            cache = LLMResponseCache(store)  # A fresh process: empty memory tier
+            self.assertEqual(await cache.get("k"), "response")
+            self.assertEqual(await cache.get("k"), "response")
+            self.assertIsNone(await cache.get("other"))
+            return cache, store
+
+        cache, store = asyncio.run(run())
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["persistent_hits"], stats["misses"]), (1, 1, 1))
+        # The promoted entry keeps the persisted expiry instead of a fresh TTL
+        expected = store.stored["k"]["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+        self.assertAlmostEqual(cache.entries["k"][1], expected, places=3)
+
+    def test_persistent_tier_is_trimmed_periodically(self):
+        async def run():
+            store = AsyncLLMStore()
+            cache = LLMResponseCache(store)
+            for i in range(LLMResponseCache.TRIM_EVERY * 2):
+                await cache.put(f"k{i}", "model", "response")
+            return store
+        self.assertEqual(asyncio.run(run()).trims, 2)
+
+    def test_key_depends_on_params(self):
+        self.assertEqual(LLMResponseCache.make_key("m", "p", {"a": 1, "b": 2}),
+                         LLMResponseCache.make_key("m", "p", {"b": 2, "a": 1}))
+        self.assertNotEqual(LLMResponseCache.make_key("m", "p", {"temperature": 0}),
+                            LLMResponseCache.make_key("m", "p", {"temperature": 1}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+from vector_index import VectorIndex
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def exact_top(vectors, query, k):
+    """Brute-force reference: indexes of the k rows with the highest cosine similarity."""
+    units = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = units @ (query / np.linalg.norm(query))
+    return list(np.argsort(scores)[::-1][:k])
+
+class TestVectorIndex(unittest.TestCase):
+    def test_exact_search_matches_brute_force(self):
+        vectors = random_vectors(200)
+        index = VectorIndex(mode="exact")
+        index.add("doc", vectors)
+        query = random_vectors(1, seed=1)[0]
+
+        results = index.search(query, k=5)
+        self.assertEqual([chunk for _, chunk, _ in results], exact_top(vectors, query, 5))
+        scores = [score for _, _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_search_after_incremental_adds(self):
+        """Vectors added after earlier searches (and past the first growth) are found."""
+        index = VectorIndex(mode="exact")
+        documents = {f"doc{i}": random_vectors(300, seed=i) for i in range(5)}
+        for document_id, vectors in documents.items():
+            index.add(document_id, vectors)
+            self.assertEqual(index.search(vectors[7], k=1)[0][:2], (document_id, 7))
+        self.assertEqual(len(index), 1500)
+
+        # Earlier documents survive the matrix being regrown
+        for document_id, vectors in documents.items():
+            document, chunk, score = index.search(vectors[42], k=1)[0]
+            self.assertEqual((document, chunk), (document_id, 42))
+            self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_ivf_finds_exact_matches_after_incremental_adds(self):
+        index = VectorIndex(mode="ivf", nprobe=4)
+        first, second = random_vectors(400, seed=1), random_vectors(1200, seed=2)
+        index.add("first", first)
+        self.assertEqual(index.search(first[3], k=1)[0][:2], ("first", 3))
+
+        # Triples the index, so the next search retrains the centroids
+        index.add("second", second)
+        for document_id, vectors in (("first", first), ("second", second)):
+            for chunk in (0, 99, 399):
+                self.assertEqual(index.search(vectors[chunk], k=1)[0][:2], (document_id, chunk))
+        self.assertEqual(index.trained_size, 1600)
+
+    def test_ivf_returns_k_results(self):
+        """Sparse probed lists fall back to an exact scan rather than returning fewer results."""
+        index = VectorIndex(mode="ivf", nprobe=1)
+        index.add("doc", random_vectors(100))
+        self.assertEqual(len(index.search(random_vectors(1, seed=3)[0], k=50)), 50)
+
+    def test_empty_index(self):
+        self.assertEqual(VectorIndex().search(np.ones(4)), [])
+
+    def test_k_larger_than_index(self):
+        index = VectorIndex()
+        index.add("doc", random_vectors(3))
+        self.assertEqual(len(index.search(np.ones(16), k=10)), 3)
+
+    def test_dimension_mismatch_is_rejected(self):
+        index = VectorIndex()
+        index.add("doc", random_vectors(2, dim=8))
+        with self.assertRaises(ValueError):
+            index.add("other", random_vectors(2, dim=16))
+
+    def test_load_skips_other_dimensions(self):
+        class Store:
+            def iter_embeddings(self, model=None):
+                yield {"document_id": "a", "embeddings": random_vectors(2, dim=8).tolist()}
+                yield {"document_id": "b", "embeddings": random_vectors(2, dim=16).tolist()}
+                yield {"document_id": "c", "embeddings": None}
+
+        index = VectorIndex(dim=8).load(Store())
+        self.assertEqual(len(index), 2)
+        self.assertEqual({document for document, _ in index.ids}, {"a"})
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            VectorIndex(mode="approximate")
+
+if __name__ == '__main__':
+    unittest.main()
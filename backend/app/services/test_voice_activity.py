@@ -0,0 +1,91 @@
+import math
+import unittest
+import numpy as np
+from voice_activity import VoiceActivityDetector
+
+SAMPLE_RATE = 16000
+
+def block(amplitude, samples):
+    """Constant-amplitude int16 PCM, whose RMS is exactly the amplitude."""
+    return np.full(samples, amplitude, dtype=np.int16).tobytes()
+
+class TestVoiceActivityDetector(unittest.TestCase):
+    def detector(self, **overrides):
+        # No smoothing, so each block's energy takes effect immediately and timing is exact
+        options = dict(sample_rate=SAMPLE_RATE, start_threshold=500, stop_threshold=300,
+                       hangover_seconds=1.0, min_duration_seconds=0.0,
+                       no_speech_timeout_seconds=10.0, smoothing_seconds=0.0)
+        options.update(overrides)
+        return VoiceActivityDetector(**options)
+
+    def blocks_until_end(self, vad, amplitude, samples, limit=1000):
+        for count in range(1, limit + 1):
+            if vad.update(block(amplitude, samples)):
+                return count
+        return None
+
+    def test_hangover_is_measured_in_samples(self):
+        """The utterance ends after hangover_seconds of silence whatever the block size."""
+        for samples in (256, 1000, 1024, 4000):
+            vad = self.detector()
+            vad.update(block(2000, SAMPLE_RATE))
+            self.assertTrue(vad.speaking)
+            self.assertEqual(self.blocks_until_end(vad, 0, samples), math.ceil(SAMPLE_RATE / samples))
+
+    def test_short_pause_does_not_end_utterance(self):
+        vad = self.detector()
+        vad.update(block(2000, 4000))
+        for _ in range(8):  # Half a second of silence, below the one-second hangover
+            self.assertFalse(vad.update(block(0, 1000)))
+        vad.update(block(2000, 1000))
+        self.assertTrue(vad.speaking)
+        # Speech resumed, so the hangover starts over
+        self.assertEqual(self.blocks_until_end(vad, 0, 1000), 16)
+
+    def test_hysteresis_between_thresholds(self):
+        """A level between the thresholds neither starts speech nor counts as silence."""
+        vad = self.detector()
+        for _ in range(20):
+            vad.update(block(400, 1000))
+        self.assertFalse(vad.heard_speech)
+
+        vad.update(block(2000, 1000))
+        for _ in range(40):  # Well past the hangover, but never below stop_threshold
+            self.assertFalse(vad.update(block(400, 1000)))
+        self.assertTrue(vad.speaking)
+
+    def test_no_speech_timeout(self):
+        vad = self.detector(min_duration_seconds=3.0)
+        self.assertEqual(self.blocks_until_end(vad, 0, 1000), 10 * SAMPLE_RATE // 1000)
+        self.assertFalse(vad.heard_speech)
+
+    def test_minimum_duration(self):
+        """Even a finished utterance keeps recording until min_duration_seconds of audio."""
+        vad = self.detector(min_duration_seconds=3.0, hangover_seconds=0.5)
+        vad.update(block(2000, 8000))
+        # Silence from 0.5s; the hangover alone would end it at 1s, the minimum holds it to 3s
+        self.assertEqual(self.blocks_until_end(vad, 0, 1000), (3 * SAMPLE_RATE - 8000) // 1000)
+
+    def test_smoothing_delays_but_does_not_prevent_detection(self):
+        vad = self.detector(smoothing_seconds=0.05)
+        vad.update(block(2000, 256))
+        vad.update(block(2000, 256))
+        for _ in range(10):
+            vad.update(block(2000, 256))
+        self.assertTrue(vad.speaking)
+
+    def test_reset(self):
+        vad = self.detector()
+        vad.update(block(2000, SAMPLE_RATE))
+        self.blocks_until_end(vad, 0, 1000)
+        self.assertTrue(vad.ended)
+        vad.reset()
+        self.assertFalse(vad.ended or vad.speaking or vad.heard_speech)
+        self.assertEqual(vad.samples_seen, 0)
+
+    def test_stop_threshold_above_start_is_rejected(self):
+        with self.assertRaises(ValueError):
+            VoiceActivityDetector(start_threshold=300, stop_threshold=500)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+from mongodb_operations import MongoDBOperations, WriteBehindBuffer, unwritten_records
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda record: record[key], reverse=direction < 0))
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.records = []
+        # (records that land first, exception) for the next insert_many calls, in order
+        self.failures = []
+
+    def insert_many(self, records, ordered=True):
+        landed, error = self.failures.pop(0) if self.failures else (None, None)
+        # Like pymongo, _ids are assigned in place before anything is sent
+        for record in records:
+            record.setdefault("_id", ObjectId())
+        ids = {record["_id"] for record in self.records}
+        write_errors = []
+        for index, record in enumerate(records):
+            if index == landed:
+                raise error
+            if record["_id"] in ids:
+                write_errors.append({"index": index, "code": 11000})
+                if ordered:
+                    break
+                continue
+            self.records.append(record)
+        if landed == len(records):
+            raise error  # Everything landed, but the acknowledgement was lost
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(records) - len(write_errors)})
+
+    def find(self, query, projection=None):
+        return FakeCursor(record for record in self.records
+                          if all(record.get(field) == value for field, value in query.items()))
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection(name)
+        return collection
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDatabase()
+        # A long interval keeps the background thread out of the way; tests flush explicitly
+        self.buffer = WriteBehindBuffer(self.db, max_batch_size=100, flush_interval=3600, max_retries=2)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def test_flush_writes_in_insertion_order(self):
+        for i in range(5):
+            self.buffer.add("events", {"n": i})
+        self.assertEqual(self.db["events"].records, [])
+        self.buffer.flush()
+        self.assertEqual([record["n"] for record in self.db["events"].records], list(range(5)))
+
+    def test_flush_one_collection(self):
+        self.buffer.add("events", {"n": 0})
+        self.buffer.add("other", {"n": 1})
+        self.buffer.flush("events")
+        self.assertEqual(len(self.db["events"].records), 1)
+        self.assertEqual(self.db["other"].records, [])
+
+    def test_read_your_writes(self):
+        """get_chat_history sees entries that are still sitting in the buffer."""
+        mongo_ops = MongoDBOperations.__new__(MongoDBOperations)
+        mongo_ops.chat_history = self.db["chat_history"]
+        mongo_ops.write_buffer = self.buffer
+
+        doc_id = ObjectId()
+        for i in range(3):
+            mongo_ops.buffer_chat_history({"document_id": doc_id, "role": "user",
+                                           "content": f"turn {i}", "timestamp": i})
+        history = mongo_ops.get_chat_history(str(doc_id))
+        self.assertEqual([turn["content"] for turn in history], ["turn 0", "turn 1", "turn 2"])
+
+    def test_failed_flush_is_retried_in_order(self):
+        self.db["events"].failures.append((0, AutoReconnect("connection lost")))
+        self.buffer.add("events", {"n": 0})
+        with self.assertLogs("mongodb_operations", level="ERROR"):
+            self.buffer.flush()
+        self.buffer.add("events", {"n": 1})
+        self.buffer.flush()
+        self.assertEqual([record["n"] for record in self.db["events"].records], [0, 1])
+        self.assertEqual(self.buffer.failures, {})
+
+    def test_retry_after_partial_write(self):
+        """Records that landed before the failure aren't written twice, and the rest aren't dropped."""
+        self.db["events"].failures.append((5, AutoReconnect("connection lost")))
+        for i in range(10):
+            self.buffer.add("events", {"n": i})
+        with self.assertLogs("mongodb_operations", level="ERROR") as logs:
+            self.buffer.flush()
+        self.buffer.flush()
+        self.assertEqual(sorted(record["n"] for record in self.db["events"].records), list(range(10)))
+        self.assertEqual((self.buffer.pending, self.buffer.failures), ({}, {}))
+        self.assertEqual(len(logs.output), 1)
+
+    def test_retry_after_complete_write(self):
+        """A batch that fully landed before the error is done on retry, without a drop."""
+        self.db["events"].failures.append((3, AutoReconnect("connection lost")))
+        for i in range(3):
+            self.buffer.add("events", {"n": i})
+        with self.assertLogs("mongodb_operations", level="ERROR") as logs:
+            for _ in range(4):
+                self.buffer.flush()
+        self.assertEqual(len(self.db["events"].records), 3)
+        self.assertEqual((self.buffer.pending, self.buffer.failures), ({}, {}))
+        self.assertNotIn("Dropping", "".join(logs.output))
+
+    def test_records_are_dropped_after_max_retries(self):
+        self.db["events"].failures.extend((0, AutoReconnect("connection lost")) for _ in range(3))
+        self.buffer.add("events", {"n": 0})
+        with self.assertLogs("mongodb_operations", level="ERROR") as logs:
+            for _ in range(3):
+                self.buffer.flush()
+        self.assertIn("Dropping", logs.output[-1])
+        self.assertEqual(self.buffer.pending, {})
+        self.assertEqual(self.db["events"].records, [])
+
+    def test_close_flushes_pending_writes(self):
+        self.buffer.add("events", {"n": 0})
+        self.buffer.close()
+        self.assertEqual(len(self.db["events"].records), 1)
+
+class TestUnwrittenRecords(unittest.TestCase):
+    RECORDS = [{"n": i} for i in range(5)]
+
+    def test_ordered_insert_resumes_at_first_error(self):
+        error = BulkWriteError({"writeErrors": [{"index": 2, "code": 121}], "nInserted": 2})
+        self.assertEqual(unwritten_records(self.RECORDS, error), self.RECORDS[2:])
+
+    def test_duplicate_key_counts_as_written(self):
+        error = BulkWriteError({"writeErrors": [{"index": 2, "code": 11000}], "nInserted": 2})
+        self.assertEqual(unwritten_records(self.RECORDS, error), self.RECORDS[3:])
+
+    def test_unordered_insert_retries_only_failed_records(self):
+        error = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}, {"index": 1, "code": 11000},
+                                                {"index": 3, "code": 121}], "nInserted": 2})
+        self.assertEqual(unwritten_records(self.RECORDS, error, ordered=False), [self.RECORDS[3]])
+
+    def test_bulk_error_without_write_errors(self):
+        error = BulkWriteError({"writeErrors": [], "nInserted": 4})
+        self.assertEqual(unwritten_records(self.RECORDS, error), self.RECORDS[4:])
+
+    def test_other_errors_retry_everything(self):
+        self.assertEqual(unwritten_records(self.RECORDS, AutoReconnect("lost")), self.RECORDS)
+
+if __name__ == '__main__':
+    unittest.main()
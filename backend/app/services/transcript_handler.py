@@ -0,0 +1,17 @@
+from amazon_transcribe.handlers import TranscriptResultStreamHandler
+from amazon_transcribe.model import TranscriptEvent
+
+class TranscriptHandler(TranscriptResultStreamHandler):
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.transcript = []
+
+    async def handle_transcript_event(self, transcript_event: TranscriptEvent):
+        results = transcript_event.transcript.results
+        for result in results:
+            if not result.is_partial:
+                for alt in result.alternatives:
+                    self.transcript.append(alt.transcript)
+
+    def get_transcript(self):
+        return ' '.join(self.transcript)
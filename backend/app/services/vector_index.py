@@ -0,0 +1,145 @@
+import threading
+import numpy as np
+
+class VectorIndex:
+    """
+    In-process cosine-similarity index over document chunk embeddings.
+
+    Vectors live L2-normalized in one contiguous float32 matrix that grows by doubling,
+    so incremental adds are amortized O(dim). Below approx_threshold vectors every search
+    is an exact matrix-vector product; above it (in "auto" mode) an IVF layer partitions
+    the vectors with spherical k-means and only the nprobe closest lists are scanned.
+    """
+    def __init__(self, dim=None, mode="auto", approx_threshold=50000, nprobe=8, kmeans_iterations=10):
+        if mode not in ("auto", "exact", "ivf"):
+            raise ValueError(f"Unknown index mode: {mode}")
+        self.dim = dim
+        self.mode = mode
+        self.approx_threshold = approx_threshold
+        self.nprobe = nprobe
+        self.kmeans_iterations = kmeans_iterations
+
+        self.vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self.size = 0
+        self.ids = []  # (document_id, chunk_index) for each row
+        self.lock = threading.Lock()
+
+        self.centroids = None
+        self.assignments = None  # Centroid index for each row
+        self.trained_size = 0
+
+    def __len__(self):
+        return self.size
+
+    def load(self, mongo_ops, model=None):
+        """
+        Bulk-load stored chunk embeddings from MongoDB, restricted to model if given.
+        Records whose dimension doesn't match the index are skipped, not fatal.
+        """
+        skipped = 0
+        for record in mongo_ops.iter_embeddings(model):
+            skipped += not self._load_record(record)
+        return self._loaded(skipped)
+
+    async def aload(self, mongo_ops, model=None):
+        """load() for the async Mongo layer, whose iter_embeddings is an async generator."""
+        skipped = 0
+        async for record in mongo_ops.iter_embeddings(model):
+            skipped += not self._load_record(record)
+        return self._loaded(skipped)
+
+    def _load_record(self, record):
+        embeddings = record.get("embeddings")
+        if embeddings is None:
+            return True
+        if self.dim is not None and np.atleast_2d(embeddings).shape[1] != self.dim:
+            return False
+        self.add(record["document_id"], embeddings)
+        return True
+
+    def _loaded(self, skipped):
+        if skipped:
+            print(f"Skipped {skipped} stored documents whose embeddings aren't {self.dim}-dimensional")
+        return self
+
+    def add(self, document_id, embeddings):
+        """Append a document's chunk embeddings (one row per chunk)."""
+        matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {matrix.shape[1]}")
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            self._reserve(self.size + len(matrix))
+            self.vectors[self.size:self.size + len(matrix)] = matrix
+            self.ids.extend((document_id, chunk_index) for chunk_index in range(len(matrix)))
+            if self.centroids is not None:
+                self.assignments = np.concatenate([self.assignments, self._nearest_centroids(matrix)])
+            self.size += len(matrix)
+
+    def search(self, vector, k=5):
+        """Return up to k (document_id, chunk_index, cosine similarity) tuples, best first."""
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+
+        with self.lock:
+            if self.size == 0:
+                return []
+            if self._use_ivf():
+                if self.centroids is None or self.size >= 2 * self.trained_size:
+                    self._train()
+                candidates = self._ivf_candidates(query)
+                if len(candidates) < k:
+                    candidates = None  # Probed lists too sparse; fall back to an exact scan
+            else:
+                candidates = None
+
+            vectors = self.vectors[:self.size] if candidates is None else self.vectors[candidates]
+            scores = vectors @ query
+            k = min(k, len(scores))
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+            rows = top if candidates is None else candidates[top]
+            return [(*self.ids[row], float(scores[i])) for i, row in zip(top, rows)]
+
+    def _reserve(self, capacity):
+        if capacity > len(self.vectors):
+            grown = np.empty((max(capacity, 2 * len(self.vectors), 1024), self.dim), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+
+    def _use_ivf(self):
+        return self.mode == "ivf" or (self.mode == "auto" and self.size >= self.approx_threshold)
+
+    def _train(self):
+        """Spherical k-means over (a sample of) the indexed vectors; sqrt(n) lists."""
+        data = self.vectors[:self.size]
+        nlist = max(1, int(np.sqrt(self.size)))
+        rng = np.random.default_rng(0)
+        sample = data[rng.choice(self.size, size=min(self.size, nlist * 256), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.where(norms == 0, 1, norms), centroids)
+
+        self.centroids = centroids
+        self.assignments = self._nearest_centroids(data)
+        self.trained_size = self.size
+
+    def _nearest_centroids(self, matrix):
+        return np.argmax(matrix @ self.centroids.T, axis=1)
+
+    def _ivf_candidates(self, query):
+        nprobe = min(self.nprobe, len(self.centroids))
+        probed = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+        return np.flatnonzero(np.isin(self.assignments, probed))
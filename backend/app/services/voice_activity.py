@@ -0,0 +1,68 @@
+import math
+import numpy as np
+
+class VoiceActivityDetector:
+    """
+    Streaming energy-based voice activity detector for 16-bit PCM, evaluated once per block.
+
+    Block energy (mean square, in float32) is smoothed with a time constant measured in
+    samples, so the behaviour doesn't depend on the block size. Speech starts above
+    start_threshold and only counts as stopped once energy has stayed below the lower
+    stop_threshold for hangover_seconds. This hysteresis keeps short pauses and noise near
+    one threshold from ending an utterance. Thresholds are RMS amplitudes.
+    """
+    def __init__(self, sample_rate=16000, start_threshold=500, stop_threshold=300,
+                 hangover_seconds=1.0, min_duration_seconds=3.0, no_speech_timeout_seconds=10.0,
+                 smoothing_seconds=0.05):
+        if stop_threshold > start_threshold:
+            raise ValueError("stop_threshold must not exceed start_threshold")
+        self.sample_rate = sample_rate
+        # Compared against mean squares, which saves a square root per block
+        self.start_energy = float(start_threshold) ** 2
+        self.stop_energy = float(stop_threshold) ** 2
+        self.hangover_samples = int(hangover_seconds * sample_rate)
+        self.min_samples = int(min_duration_seconds * sample_rate)
+        self.no_speech_timeout_samples = int(no_speech_timeout_seconds * sample_rate)
+        self.smoothing_samples = smoothing_seconds * sample_rate
+        self.scratch = np.empty(0, dtype=np.float32)  # Reused for every block's float conversion
+        self.reset()
+
+    def reset(self):
+        self.energy = 0.0
+        self.samples_seen = 0
+        self.quiet_samples = 0  # Consecutive samples below stop_threshold while speaking
+        self.speaking = False
+        self.heard_speech = False
+        self.ended = False
+
+    def update(self, block):
+        """Feed one block of int16 PCM bytes or samples; returns True once the utterance has ended."""
+        samples = np.frombuffer(block, dtype=np.int16)
+        count = len(samples)
+        if count == 0:
+            return self.ended
+        if len(self.scratch) < count:
+            self.scratch = np.empty(count, dtype=np.float32)
+        scaled = self.scratch[:count]
+        np.copyto(scaled, samples)
+        block_energy = float(np.dot(scaled, scaled)) / count
+
+        # Exponential smoothing with a weight derived from the block's duration
+        weight = 1.0 - math.exp(-count / self.smoothing_samples) if self.smoothing_samples else 1.0
+        self.energy += weight * (block_energy - self.energy)
+        self.samples_seen += count
+
+        if not self.speaking:
+            if self.energy >= self.start_energy:
+                self.speaking = self.heard_speech = True
+                self.quiet_samples = 0
+        elif self.energy < self.stop_energy:
+            self.quiet_samples += count
+            if self.quiet_samples >= self.hangover_samples:
+                self.speaking = False
+        else:
+            self.quiet_samples = 0
+
+        if self.samples_seen >= self.min_samples and not self.speaking:
+            self.ended = self.heard_speech or self.samples_seen >= self.no_speech_timeout_samples
+        return self.ended